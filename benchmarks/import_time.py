@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: https://omnipathdb.org/
+#
+
+#
+# Measures the import time of the package by `python -X importtime` and
+# fails (exit status 1) if it is above a threshold, if, compared to a
+# saved baseline, it is above a tolerance, or if any of the heavy modules
+# deferred to the point of use has been imported. Without arguments the
+# default threshold, the forbidden modules and, if it exists, the baseline
+# in `benchmarks/import_time.json` are checked. Usage:
+#
+#     python benchmarks/import_time.py
+#     python benchmarks/import_time.py --threshold 3
+#     python benchmarks/import_time.py --save
+#     python benchmarks/import_time.py --baseline importtime.json
+#
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+
+reimporttime = re.compile(
+    r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)([\w\.]+)'
+)
+
+# import time limit in seconds
+DEFAULT_THRESHOLD = 3.
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'import_time.json',
+)
+# these are imported only where they are used
+DEFAULT_FORBIDDEN = (
+    'matplotlib',
+    'scipy',
+    'data_tools',
+    'pattern',
+)
+
+
+def import_time(module = 'omnipath2.main', repeat = 3):
+    """
+    Imports a module in fresh interpreters and returns the best
+    cumulative import time in seconds, and the self times of the modules
+    from the same run.
+    """
+
+    best = None
+
+    for _ in range(repeat):
+
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+            stdout = subprocess.PIPE,
+            stderr = subprocess.PIPE,
+            universal_newlines = True,
+            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+
+        if proc.returncode:
+
+            sys.stderr.write(proc.stderr)
+            sys.exit(2)
+
+        total = 0
+        self_times = {}
+
+        for line in proc.stderr.split('\n'):
+
+            m = reimporttime.match(line)
+
+            if not m:
+
+                continue
+
+            self_us, cumulative_us, indent, name = m.groups()
+            self_times[name] = int(self_us) / 1e6
+
+            # top level imports only, the nested ones are included
+            # in the cumulative time of these
+            if len(indent) == 1:
+
+                total += int(cumulative_us)
+
+        total /= 1e6
+
+        if best is None or total < best[0]:
+
+            best = (total, self_times)
+
+    return best
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = 'Checks the import time of omnipath2.',
+    )
+    parser.add_argument('--module', default = 'omnipath2.main')
+    parser.add_argument(
+        '--threshold',
+        type = float,
+        default = DEFAULT_THRESHOLD,
+        help = 'Maximum import time in seconds, 0 disables this check.',
+    )
+    parser.add_argument(
+        '--baseline',
+        default = DEFAULT_BASELINE,
+        help = 'JSON file with the import time of a previous run.',
+    )
+    parser.add_argument(
+        '--forbidden',
+        nargs = '*',
+        default = DEFAULT_FORBIDDEN,
+        help = 'Top level modules which must not be imported.',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type = float,
+        default = .2,
+        help = 'Allowed increase compared to the baseline (fraction).',
+    )
+    parser.add_argument(
+        '--save',
+        action = 'store_true',
+        help = 'Save the result as the new baseline.',
+    )
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--top', type = int, default = 15)
+    args = parser.parse_args()
+
+    total, self_times = import_time(args.module, repeat = args.repeat)
+
+    sys.stdout.write('Import time of `%s`: %.03f s\n' % (args.module, total))
+    sys.stdout.write('Slowest modules (self time):\n')
+
+    for name, t in sorted(
+        self_times.items(),
+        key = lambda it: it[1],
+        reverse = True,
+    )[:args.top]:
+
+        sys.stdout.write('    %-50s%8.03f s\n' % (name, t))
+
+    failed = False
+    forbidden = sorted({
+        name
+        for name in self_times
+        if name.split('.')[0] in args.forbidden
+    })
+
+    if forbidden:
+
+        sys.stdout.write(
+            'FAILED: modules imported which should be deferred: '
+            '%s.\n' % ', '.join(forbidden)
+        )
+        failed = True
+
+    if args.threshold and total > args.threshold:
+
+        sys.stdout.write(
+            'FAILED: above the threshold of %.03f s.\n' % args.threshold
+        )
+        failed = True
+
+    if args.baseline and not args.save and os.path.exists(args.baseline):
+
+        with open(args.baseline, 'r') as fp:
+
+            baseline = json.load(fp)['total']
+
+        limit = baseline * (1 + args.tolerance)
+
+        if total > limit:
+
+            sys.stdout.write(
+                'FAILED: %.03f s is above the baseline %.03f s '
+                'by more than %.0f%%.\n' % (
+                    total,
+                    baseline,
+                    args.tolerance * 100,
+                )
+            )
+            failed = True
+
+    if args.baseline and args.save:
+
+        with open(args.baseline, 'w') as fp:
+
+            json.dump({'module': args.module, 'total': total}, fp)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: https://omnipathdb.org/
+#
+
+#
+# Checks the network data frames on a small network: takes the first
+# interactions of a dataset, creates their data frames and fails (exit
+# status 1) if a check doesn't pass. The checks: the cached data frames
+# are read back unchanged, and the plain data frame derived from the by
+# source one (see the `network_df_single_pass` setting) is equal to the
+# one created from the network. Usage:
+#
+#     python benchmarks/network_df_checks.py [dataset] [size]
+#
+
+import os
+import sys
+import itertools
+import tempfile
+import collections
+
+import pandas as pd
+
+import omnipath2
+from omnipath2 import chunked
+from omnipath2 import database
+from pypath.core import network
+
+
+def small_network(dataset = 'omnipath', size = 500):
+    """
+    A new network with the first ``size`` interactions of a dataset.
+    """
+
+    db = omnipath2.data.get_db(dataset)
+    net = network.Network()
+
+    for key in itertools.islice(db.interactions.keys(), size):
+
+        net.add_interaction(db.interactions[key])
+
+    return net
+
+
+def _value(val):
+
+    if isinstance(val, (set, frozenset)):
+
+        return frozenset(val)
+
+    # arrays or lists: the sets haven't been restored
+    if hasattr(val, '__len__') and not isinstance(val, str):
+
+        return tuple(val)
+
+    if pd.isna(val):
+
+        return None
+
+    return val
+
+
+def _rows(df):
+
+    return collections.Counter(
+        tuple(_value(val) for val in row)
+        for row in df.astype(object).itertuples(index = False)
+    )
+
+
+def frames_equal(df0, df1):
+    """
+    Tells if two data frames have the same columns and the same rows,
+    regardless of the order of the rows.
+    """
+
+    return (
+        list(df0.columns) == list(df1.columns) and
+        _rows(df0) == _rows(df1)
+    )
+
+
+def check_cache_round_trip(net):
+    """
+    The data frames written to the cache and read back are equal to
+    the original ones, with sets in the columns of sets.
+    """
+
+    result = True
+
+    for by_source, ext in itertools.product(
+        (False, True),
+        ('feather', 'parquet'),
+    ):
+
+        net.make_df(by_source = by_source)
+        df = net.df
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            path = os.path.join(tmp_dir, 'network_df.%s' % ext)
+            chunked.write_frame(df, path)
+            result = _report(
+                'cache round trip (by_source=%s, %s)' % (by_source, ext),
+                frames_equal(df, chunked.read_frame(path)),
+            ) and result
+
+    return result
+
+
+def check_single_pass(net):
+    """
+    The plain data frame aggregated from the by source one is equal to
+    the plain data frame created from the network. The
+    ``network_df_single_pass`` setting can be enabled only if this
+    check passes.
+    """
+
+    net.make_df(by_source = True)
+    derived = database.Database._plain_from_by_source(net.df)
+    net.make_df(by_source = False)
+
+    return _report(
+        'plain data frame from the by source one',
+        frames_equal(net.df, derived),
+    )
+
+
+def _report(name, passed):
+
+    sys.stdout.write('%s: %s\n' % ('PASSED' if passed else 'FAILED', name))
+
+    return passed
+
+
+def main():
+
+    dataset = sys.argv[1] if len(sys.argv) > 1 else 'omnipath'
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    net = small_network(dataset, size)
+
+    passed = all([
+        check_cache_round_trip(net),
+        check_single_pass(net),
+    ])
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: https://omnipathdb.org/
+#
+
+#
+# Compares the storage backends of the datasets: save time, load time and
+# file size for each dataset. Usage:
+#
+#     python benchmarks/storage_backends.py [outdir] [dataset ...]
+#
+# The datasets are loaded by the default `Database` of `omnipath2`, then
+# saved and loaded again by each backend in `outdir`.
+#
+
+import os
+import sys
+import time
+
+import omnipath2
+from omnipath2 import storage
+
+
+def benchmark(dataset, outdir, backends = None):
+
+    backends = backends or [
+        backend
+        for backend in storage.BACKENDS.keys()
+        if storage.available(backend)
+    ]
+
+    db = omnipath2.data.get_db(dataset)
+    result = []
+
+    for backend in backends:
+
+        path = os.path.join(
+            outdir,
+            '%s_bmark.pickle%s' % (dataset, storage.suffix(backend)),
+        )
+
+        t0 = time.time()
+        omnipath2.data.save_db(db, path, backend = backend)
+        save_time = time.time() - t0
+
+        t0 = time.time()
+        _ = omnipath2.data.read_db(dataset, path, backend = backend)
+        load_time = time.time() - t0
+
+        result.append([
+            dataset,
+            backend,
+            '%.02f' % save_time,
+            '%.02f' % load_time,
+            '%u' % os.path.getsize(path),
+        ])
+
+        os.remove(path)
+
+    # restore the module level database
+    omnipath2.data.load_dataset(dataset)
+
+    return result
+
+
+def main(outdir = 'bmark_storage', datasets = None):
+
+    os.makedirs(outdir, exist_ok = True)
+    datasets = datasets or omnipath2.data.datasets
+    header = ['dataset', 'backend', 'save_s', 'load_s', 'size_bytes']
+    result = []
+
+    for dataset in datasets:
+
+        result.extend(benchmark(dataset, outdir))
+        omnipath2.data.evict(dataset)
+
+    with open(os.path.join(outdir, 'storage_backends.tsv'), 'w') as fp:
+
+        fp.write('\n'.join('\t'.join(line) for line in [header] + result))
+
+    for line in [header] + result:
+
+        sys.stdout.write('%-14s%-10s%10s%10s%16s\n' % tuple(line))
+
+
+if __name__ == '__main__':
+
+    main(
+        outdir = sys.argv[1] if len(sys.argv) > 1 else 'bmark_storage',
+        datasets = sys.argv[2:],
+    )
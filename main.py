@@ -25,16 +25,14 @@
 import importlib as imp
 
 import omnipath2.main
-from omnipath2 import settings
 from pypath.resources import data_formats
 from pypath.resources import network as netres
 from pypath.core import annot
 
 def kegg_off():
 
-    settings.setup(tf_target_pickle = 'tftarget_paper.pickle')
-    settings.setup(omnipath_pickle = 'omnipath_paper.pickle')
-    settings.setup(annotations_pickle = 'annotations_paper.pickle')
+    # the pickle file names contain a fingerprint of the build
+    # parameters, hence datasets without KEGG get their own pickles
     del data_formats.pathway_noref['kegg']
     del data_formats.transcription_onebyone['kegg']
     del data_formats.transcription['kegg']
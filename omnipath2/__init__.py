@@ -72,7 +72,17 @@ def setup(environment):
         pp_settings.setup(cachedir = pp_cachedir)
 
 
-def init(environment = None, **kwargs):
+def init(environment = None, names = None, **kwargs):
+    """
+    Creates the package level objects.
+
+    environment : str
+        Name of the settings environment, by default the user name.
+    names : list
+        Names of the objects to create (``data``, ``colors`` or
+        ``files``), by default all of them. If only some objects are
+        created, the environment is set up only at the first call.
+    """
 
     param = (
         copy.deepcopy(globals()['OP2_DB_ARGS'])
@@ -89,13 +99,94 @@ def init(environment = None, **kwargs):
 
     param.update(kwargs)
 
-    environment = environment or os.path.split(os.path.expanduser('~'))[-1]
+    if names is None or not globals().get('_environment_ready'):
+
+        environment = (
+            environment or
+            os.path.split(os.path.expanduser('~'))[-1]
+        )
+        setup(environment)
+        globals()['_environment_ready'] = True
+
+    for name in names or ('data', 'colors', 'files'):
+
+        globals()[name] = (
+            _database_mod.Database(**param)
+                if name == 'data' else
+            _colors_mod.Colors()
+                if name == 'colors' else
+            _files_mod.Files()
+        )
+
+
+class _LazyInit(object):
+    """
+    Placeholder for one of the package level objects (``data``, ``colors``
+    and ``files``). At the first attribute access it creates only this
+    object by ``init`` and from then on it forwards everything to the
+    real object.
+    """
+
+
+    def __init__(self, name):
+
+        object.__setattr__(self, '_name', name)
+
+
+    def _obj(self):
+
+        if isinstance(globals()[self._name], _LazyInit):
+
+            init(names = (self._name,))
+
+        return globals()[self._name]
+
+
+    def __getattr__(self, attr):
+
+        return getattr(self._obj(), attr)
+
+
+    def __setattr__(self, attr, value):
+
+        setattr(self._obj(), attr, value)
+
+
+    def __delattr__(self, attr):
+
+        delattr(self._obj(), attr)
+
+
+    def __bool__(self):
+
+        # the objects are always true, their truth value must not depend
+        # on ``__len__`` and must not initialize them
+        return True
+
+
+    def __len__(self):
+
+        return len(self._obj())
+
+
+    def __repr__(self):
+
+        return (
+            '<Not initialized: %s>' % self._name
+                if isinstance(globals()[self._name], _LazyInit) else
+            repr(self._obj())
+        )
+
+
+def lazy_init():
+    """
+    Sets up placeholders for the package level objects, these will be
+    initialized by ``init`` at their first use.
+    """
 
-    setup(environment)
+    for name in ('data', 'colors', 'files'):
 
-    globals()['data'] = _database_mod.Database(**param)
-    globals()['colors'] = _colors_mod.Colors()
-    globals()['files'] = _files_mod.Files()
+        globals()[name] = _LazyInit(name)
 
 
-init()
+lazy_init()
@@ -24,8 +24,6 @@
 
 import itertools
 
-import pattern.en
-
 from pypath.share import common
 from pypath.share import session as session_mod
 from pypath.core import annot
@@ -34,6 +32,9 @@ import omnipath2
 import omnipath2.settings as op2_settings
 import omnipath2.plot as plot
 import omnipath2.intercell_plots
+from omnipath2 import lazy
+
+pattern_en = lazy.lazy_import('pattern.en')
 
 
 class EntitiesByResource(omnipath2.intercell_plots.CountsScatterBase):
@@ -50,17 +51,17 @@ class EntitiesByResource(omnipath2.intercell_plots.CountsScatterBase):
         param = {
             'fname': 'annot_entities_by_resource_pdf',
             'fname_param': (
-                '-'.join(pattern.en.pluralize(et) for et in self.entity_types)
+                '-'.join(pattern_en.pluralize(et) for et in self.entity_types)
                     if self.entity_types else
                 'all-entities'
             ),
             'title': 'Number of %s by annotation resource' % (
-                pattern.en.pluralize(entity_types)
+                pattern_en.pluralize(entity_types)
                     if isinstance(entity_types, common.basestring) else
                 'entities'
             ),
             'xlab': 'Number of %s' % (
-                pattern.en.pluralize(entity_types)
+                pattern_en.pluralize(entity_types)
                     if isinstance(entity_types, common.basestring) else
                 'entities'
             ),
@@ -162,13 +163,13 @@ class AnnotationNetworkOverlap(omnipath2.intercell_plots.CountsScatterBase):
                 self.network_dataset,
             ),
             'title': ' %s in the network (%s)\nby annotation resource' % (
-                pattern.en.pluralize(entity_types).capitalize()
+                pattern_en.pluralize(entity_types).capitalize()
                     if isinstance(entity_types, common.basestring) else
                 'all',
                 self.network_dataset,
             ),
             'xlab': ' %s in the network' % (
-                pattern.en.pluralize(entity_types).capitalize()
+                pattern_en.pluralize(entity_types).capitalize()
                     if isinstance(entity_types, common.basestring) else
                 'Entities'
             ),
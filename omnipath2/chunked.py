@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import json
+
+from pypath.share import session as session_mod
+
+from omnipath2 import lazy
+
+pd = lazy.lazy_import('pandas')
+pa = lazy.lazy_import('pyarrow')
+pq = lazy.lazy_import('pyarrow.parquet')
+np = lazy.lazy_import('numpy')
+
+
+_logger = session_mod.Logger(name = 'op2.chunked')
+_log = _logger._log
+
+# key in the Parquet schema metadata listing the columns of sets
+SET_COLUMNS_KEY = b'op2_set_columns'
+
+
+def _to_arrow(df):
+    """
+    Converts the columns of sets to lists of strings and the categorical
+    columns to strings. The categories of each chunk are different, hence
+    they can't be written under one schema.
+    """
+
+    df = df.reset_index(drop = True)
+    set_columns = []
+
+    for col in df.columns:
+
+        if df[col].dtype.name == 'category':
+
+            df[col] = df[col].astype(object)
+
+        elif df[col].dtype == object and any(
+            isinstance(val, (set, frozenset))
+            for val in df[col]
+        ):
+
+            df[col] = [
+                sorted(str(v) for v in val) if val else []
+                for val in df[col]
+            ]
+            set_columns.append(col)
+
+    return df, set_columns
+
+
+def sets_to_lists(df):
+    """
+    Converts the sets in the object columns to lists, Arrow can not store
+    sets. The missing values remain None. Returns the data frame and the
+    names of the columns of sets.
+    """
+
+    set_columns = []
+
+    for col in df.columns:
+
+        if df[col].dtype == object and any(
+            isinstance(val, (set, frozenset))
+            for val in df[col]
+        ):
+
+            df[col] = [
+                list(val) if val is not None else None
+                for val in df[col]
+            ]
+            set_columns.append(col)
+
+    return df, set_columns
+
+
+def restore_sets(df, columns = None):
+    """
+    Converts the arrays (lists) read from Arrow back to sets. The missing
+    values remain None.
+
+    df : pandas.DataFrame
+        Data frame read from a Parquet or Feather file.
+    columns : list
+        The columns of sets. If None, all object columns holding arrays
+        or lists are converted.
+    """
+
+    if columns is None:
+
+        columns = [
+            col
+            for col in df.columns
+            if df[col].dtype == object and any(
+                isinstance(val, (list, tuple, np.ndarray))
+                for val in df[col]
+                if val is not None
+            )
+        ]
+
+    for col in columns:
+
+        if col in df.columns:
+
+            df[col] = [
+                set(val) if val is not None else None
+                for val in df[col]
+            ]
+
+    return df
+
+
+def _non_null_schema(schema):
+    """
+    Columns empty in the first chunk have null type; we store them as
+    strings so the later chunks fit into the schema.
+    """
+
+    fields = []
+
+    for field in schema:
+
+        if pa.types.is_null(field.type):
+
+            field = field.with_type(pa.string())
+
+        elif (
+            pa.types.is_list(field.type) and
+            pa.types.is_null(field.type.value_type)
+        ):
+
+            field = field.with_type(pa.list_(pa.string()))
+
+        fields.append(field)
+
+    return pa.schema(fields, metadata = schema.metadata)
+
+
+def write(chunks, path):
+    """
+    Writes data frames to one Parquet file, each of them as a separate
+    row group, without holding more than one of them in memory.
+
+    chunks : iterable
+        Data frames with the same columns.
+    path : str
+        Path to the output file.
+    """
+
+    tmp_path = '%s.tmp' % path
+    writer = None
+    schema = None
+    n_rows = 0
+
+    try:
+
+        for df in chunks:
+
+            df, set_columns = _to_arrow(df)
+
+            if writer is None:
+
+                schema = pa.Schema.from_pandas(df, preserve_index = False)
+                schema = _non_null_schema(schema).with_metadata(
+                    dict(
+                        schema.metadata or {},
+                        **{SET_COLUMNS_KEY: json.dumps(set_columns)}
+                    )
+                )
+                writer = pq.ParquetWriter(tmp_path, schema)
+
+            table = pa.Table.from_pandas(
+                df,
+                schema = schema,
+                preserve_index = False,
+            )
+            writer.write_table(table, row_group_size = max(len(df), 1))
+            n_rows += len(df)
+
+    finally:
+
+        if writer is not None:
+
+            writer.close()
+
+    if writer is None:
+
+        raise ValueError('No data to write to `%s`.' % path)
+
+    os.replace(tmp_path, path)
+
+    _log(
+        'Written %u rows in %u chunks to `%s`.' % (
+            n_rows,
+            pq.ParquetFile(path).num_row_groups,
+            path,
+        )
+    )
+
+
+def read(path, columns = None):
+    """
+    Iterates over the row groups of a Parquet file written by ``write``,
+    yields data frames. The columns of sets are restored.
+
+    path : str
+        Path to the Parquet file.
+    columns : list
+        Read only these columns.
+    """
+
+    parquet = pq.ParquetFile(path)
+    metadata = parquet.schema_arrow.metadata or {}
+    set_columns = json.loads(metadata.get(SET_COLUMNS_KEY, b'[]'))
+
+    for i in range(parquet.num_row_groups):
+
+        df = parquet.read_row_group(i, columns = columns).to_pandas()
+
+        yield restore_sets(df, set_columns)
+
+
+def write_frame(df, path):
+    """
+    Writes a data frame to one Feather or Parquet file, depending on the
+    extension of ``path``. The sets are stored as lists.
+    """
+
+    df = df.reset_index(drop = True)
+    df, _ = sets_to_lists(df)
+
+    if path.endswith('parquet'):
+
+        df.to_parquet(path)
+
+    else:
+
+        df.to_feather(path)
+
+
+def read_frame(path):
+    """
+    Reads a data frame written by ``write_frame``, the columns of sets
+    are restored.
+    """
+
+    df = (
+        pd.read_parquet(path)
+            if path.endswith('parquet') else
+        pd.read_feather(path)
+    )
+
+    return restore_sets(df)
@@ -26,15 +26,16 @@ import os
 import re
 import importlib as imp
 import collections
-
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.colors
 import colorsys
 
 from pypath.share import session as session_mod
 
 from omnipath2 import settings as op2_settings
+from omnipath2 import lazy
+
+# matplotlib is slow to import and needed only for plotting
+mpl_colors = lazy.lazy_import('matplotlib.colors')
+plt = lazy.lazy_import('matplotlib.pyplot')
 
 
 recolor = re.compile(
@@ -136,7 +137,7 @@ class Colors(session_mod.Logger):
         object.
         """
 
-        return mpl.colors.ListedColormap(
+        return mpl_colors.ListedColormap(
             list(self.palettes[name].values())
         )
 
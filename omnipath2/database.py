@@ -23,23 +23,44 @@
 #
 
 import os
-import sys
 import importlib as imp
 import time
 import pprint
 import copy
 import collections
 import itertools
-
-import pypath.resources.network as netres
-from pypath.core import annot
-from pypath.core import intercell
-from pypath.core import complex
-from pypath.core import enz_sub
+import concurrent.futures
+import hashlib
+import glob
+import shutil
+import threading
+import contextlib
+import json
+import traceback
+import multiprocessing
+
+import pypath
 from pypath.share import session as session_mod
-from pypath.core import network
+from pypath.share import common
 
 import omnipath2.settings as op2_settings
+from omnipath2 import lazy
+from omnipath2 import storage
+from omnipath2 import fingerprint
+from omnipath2 import input_cache as input_cache_mod
+from omnipath2 import server as server_mod
+from omnipath2 import entity_index as entity_index_mod
+from omnipath2 import snapshot
+from omnipath2 import chunked
+from omnipath2 import input_bundle
+from omnipath2 import profiling
+
+# these are slow to import and not needed in every run
+pd = lazy.lazy_import('pandas')
+pyarrow = lazy.lazy_import('pyarrow')
+netres = lazy.lazy_import('pypath.resources.network')
+annot = lazy.lazy_import('pypath.core.annot')
+network = lazy.lazy_import('pypath.core.network')
 
 
 class Database(session_mod.Logger):
@@ -55,6 +76,35 @@ class Database(session_mod.Logger):
         self.datasets = self.get_param('datasets')
         self.ensure_dirs()
         self.network_dfs = {}
+        # datasets built in this session, these won't be rebuilt again
+        self._built = set()
+        # estimated memory use of the loaded datasets and their network
+        # data frames, in the order of their last access
+        self._resident = collections.OrderedDict()
+        # guards the bookkeeping (`_resident`, `network_dfs`, `stats`)
+        # changed by the prefetch thread too
+        self._state_lock = threading.RLock()
+        # datasets used by the running job, these are not evicted
+        self._protected = []
+        # one lock for each dataset, so the datasets can be loaded in
+        # background threads
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # the datasets of the same pypath module share its module level
+        # ``db``, the threads must not set or delete it at the same time
+        self._module_locks = {}
+        self._prefetching = {}
+        self._prefetch_executor = None
+        # time, memory and file size records for each dataset
+        self.stats = {}
+        self._input_cache = None
+        self._input_cache_dir = None
+        self.server = None
+        # integer codes of the entities, shared by all datasets
+        self.entity_index = entity_index_mod.EntityIndex()
+        self._entity_codes = {}
+        self._access_records = []
+        self._build_fingerprints = {}
 
         self._log('OmniPath2 database builder initialized.')
 
@@ -72,13 +122,172 @@ class Database(session_mod.Logger):
         self.foreach_dataset(method = self.reload_module)
 
 
-    def build(self):
+    def build(self, processes = None):
+        """
+        Builds all datasets. With more than one process the datasets are
+        built in a process pool following the order of the
+        ``dependencies`` setting. In this case the workers only save the
+        pickles and the datasets are loaded later on demand.
+        """
+
+        processes = processes or self.get_param('build_processes') or 1
+
+        self._log(
+            'Building databases. Rebuild forced: %s. '
+            'Number of processes: %u.' % (str(self.rebuild), processes)
+        )
+
+        # the inputs are shared between the processes only within one
+        # build session, later the files or pypath might change
+        self.close_input_cache()
+        self._input_cache_dir = (
+            os.path.join(
+                self.get_param('pickle_dir'),
+                'input_cache',
+                '%s_%u' % (self.timestamp, os.getpid()),
+            )
+                if self.get_param('input_cache_shared') else
+            None
+        )
+
+        try:
+
+            if processes > 1:
+
+                self.build_parallel(processes = processes)
+
+            else:
+
+                self.foreach_dataset(method = self.ensure_dataset)
+
+        finally:
+
+            self.close_input_cache()
+
+
+    def build_parallel(self, processes = None, datasets = None):
+        """
+        Builds the datasets which are missing or need to be rebuilt in a
+        pool of worker processes. A dataset is submitted to the pool once
+        all the datasets it depends on have been saved.
+        """
+
+        processes = processes or self.get_param('build_processes') or 1
+        datasets = self.dataset_closure(datasets or self.datasets)
+        to_build = {
+            dataset
+            for dataset in datasets
+            if not self.is_view(dataset) and self.needs_rebuild(dataset)
+        }
+        # views are not built, but they are ready only once their
+        # parents have been saved
+        views = {dataset for dataset in datasets if self.is_view(dataset)}
+        done = set(datasets) - to_build - views
+        worker_param = self._worker_param()
+        worker_param['parallel_worker'] = True
 
         self._log(
-            'Building databases. Rebuild forced: %s.' % str(self.rebuild)
+            'Building %u datasets in %u processes: %s.' % (
+                len(to_build),
+                processes,
+                ', '.join(sorted(to_build)) or 'none',
+            )
+        )
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers = processes,
+        ) as executor:
+
+            running = {}
+
+            while to_build or running:
+
+                ready_views = True
+
+                while ready_views:
+
+                    ready_views = {
+                        view
+                        for view in views
+                        if set(self.dataset_dependencies(view)) <= done
+                    }
+                    done.update(ready_views)
+                    views -= ready_views
+
+                ready = sorted(
+                    dataset
+                    for dataset in to_build
+                    if set(self.dataset_dependencies(dataset)) <= done
+                )
+
+                for dataset in ready:
+
+                    to_build.discard(dataset)
+                    self.remove_db(dataset)
+                    self.network_dfs.pop(dataset, None)
+                    running[
+                        executor.submit(
+                            _build_dataset_worker,
+                            dataset,
+                            worker_param,
+                        )
+                    ] = dataset
+                    self._log('Submitted dataset `%s` to build.' % dataset)
+
+                if not running:
+
+                    raise RuntimeError(
+                        'Circular or unresolvable dataset dependencies: '
+                        '%s.' % ', '.join(sorted(to_build))
+                    )
+
+                finished, _ = concurrent.futures.wait(
+                    running,
+                    return_when = concurrent.futures.FIRST_COMPLETED,
+                )
+
+                for future in finished:
+
+                    dataset = running.pop(future)
+                    # raises the exception from the worker if any
+                    pickle_path, stats = future.result()
+                    self.merge_stats(stats)
+                    self.write_input_manifest()
+                    done.add(dataset)
+                    self._built.add(dataset)
+
+                    self._log(
+                        'Dataset `%s` has been built and saved to `%s`.' % (
+                            dataset,
+                            pickle_path,
+                        )
+                    )
+
+        self._log('Finished building datasets in parallel.')
+
+
+    def _worker_param(self):
+        """
+        Parameters for the ``Database`` instances in the worker processes.
+        Rebuild flags are removed as the parent decides what to build,
+        the workers only load the dependencies from the pickles.
+        """
+
+        param = dict(
+            (key, val)
+            for key, val in self.param.items()
+            if not key.startswith('rebuild_')
         )
+        # the workers must use the same directories as the parent
+        param['tables_dir'] = self.get_param('tables_dir')
+        param['figures_dir'] = self.get_param('figures_dir')
+        param['timestamp_dirs'] = False
+
+        if self.get_param('input_cache'):
 
-        self.foreach_dataset(method = self.ensure_dataset)
+            param['input_cache_dir'] = self.input_cache().shared_dir
+
+        return param
 
 
     def ensure_dataset(
@@ -88,34 +297,153 @@ class Database(session_mod.Logger):
             force_rebuild = False,
         ):
 
-        for dep_dataset in self.dataset_dependencies(dataset):
+        with self._dataset_lock(dataset):
+
+            for dep_dataset in self.dataset_dependencies(dataset):
+
+                self.ensure_dataset(dep_dataset)
+
+            if self.is_view(dataset):
+
+                if force_reload or force_rebuild or not hasattr(self, dataset):
+
+                    self.build_view(dataset)
+
+            elif force_reload or force_rebuild or not hasattr(self, dataset):
+
+                if self.needs_rebuild(dataset, force_rebuild = force_rebuild):
+
+                    self.remove_db(dataset)
+                    self.build_dataset(dataset)
+
+                elif not hasattr(self, dataset) or force_reload:
+
+                    self.load_dataset(dataset)
+
+            self._touch(dataset)
+
+
+    def _dataset_lock(self, dataset):
+
+        with self._locks_lock:
+
+            if dataset not in self._locks:
+
+                self._locks[dataset] = threading.RLock()
+
+            return self._locks[dataset]
 
-            self.ensure_dataset(dep_dataset)
 
-        rebuild_dataset = self.get_param('rebuild_%s' % dataset)
+    def _module_lock(self, dataset):
 
-        if force_reload or force_rebuild or not hasattr(self, dataset):
+        mod_str = self.dataset_module(dataset)
+
+        with self._locks_lock:
+
+            if mod_str not in self._module_locks:
+
+                self._module_locks[mod_str] = threading.RLock()
+
+            return self._module_locks[mod_str]
+
+
+    def prefetch(self, datasets):
+        """
+        Starts loading datasets in a background thread. Later calls to
+        ``get_db`` wait for the load in progress instead of starting
+        another one.
+        """
+
+        for dataset in common.to_list(datasets):
 
             if (
-                force_rebuild or
-                self.rebuild or
-                rebuild_dataset or
-                not self.pickle_exists(dataset)
+                hasattr(self, dataset) or (
+                    dataset in self._prefetching and
+                    not self._prefetching[dataset].done()
+                )
             ):
 
-                self.remove_db(dataset)
-                self.build_dataset(dataset)
+                continue
+
+            if self._prefetch_executor is None:
+
+                self._prefetch_executor = (
+                    concurrent.futures.ThreadPoolExecutor(
+                        max_workers = 1,
+                        thread_name_prefix = 'op2-prefetch',
+                    )
+                )
+
+            self._log('Prefetching dataset `%s`.' % dataset)
+
+            self._prefetching[dataset] = self._prefetch_executor.submit(
+                self._prefetch_dataset,
+                dataset,
+            )
+
+
+    def _prefetch_dataset(self, dataset):
 
-            elif not hasattr(self, dataset) or force_reload:
+        try:
 
-                self.load_dataset(dataset)
+            self.ensure_dataset(dataset)
+
+        except Exception as e:
+
+            # the dataset will be loaded again when requested
+            self._log(
+                'Failed to prefetch dataset `%s`: %s' % (dataset, str(e))
+            )
+
+
+    def needs_rebuild(self, dataset, force_rebuild = False):
+        """
+        Tells if a dataset should be built instead of loaded from its
+        pickle.
+        """
+
+        return bool(
+            force_rebuild or
+            not self.pickle_exists(dataset) or
+            (
+                dataset not in self._built and (
+                    self.rebuild or
+                    self.get_param('rebuild_%s' % dataset)
+                )
+            )
+        )
 
 
     def dataset_dependencies(self, dataset):
 
         deps = self.get_param('dependencies')
+        deps = tuple(deps[dataset]) if dataset in deps else ()
+
+        if self.is_view(dataset):
+
+            deps += (self.view_param(dataset)['parent'],)
+
+        return deps
+
+
+    def dataset_closure(self, datasets):
+        """
+        The datasets together with all the datasets they depend on.
+        """
+
+        result = []
+        datasets = list(common.to_list(datasets))
+
+        while datasets:
 
-        return deps[dataset] if dataset in deps else ()
+            dataset = datasets.pop(0)
+
+            if dataset not in result:
+
+                result.append(dataset)
+                datasets.extend(self.dataset_dependencies(dataset))
+
+        return result
 
 
     def ensure_dirs(self):
@@ -153,250 +481,2104 @@ class Database(session_mod.Logger):
 
         pickle_fname = self.get_param('%s_pickle' % dataset)
 
+        if self.get_param('pickle_fingerprint'):
+
+            stem, ext = os.path.splitext(pickle_fname)
+            pickle_fname = '%s__%s%s' % (
+                stem,
+                self.build_fingerprint(dataset),
+                ext,
+            )
+
         return os.path.join(
             self.get_param('pickle_dir'),
-            pickle_fname,
+            '%s%s' % (pickle_fname, storage.suffix(self.storage_backend())),
         )
 
 
-    def pickle_exists(self, dataset):
+    def storage_backend(self):
+        """
+        The serialization backend for the datasets, falls back to the
+        pypath pickles if the modules required by the backend in the
+        ``storage_backend`` setting are not available.
+        """
 
-        return os.path.exists(self.pickle_path(dataset))
+        backend = self.get_param('storage_backend') or 'pypath'
 
+        if not storage.available(backend):
 
-    def table_path(self, dataset):
+            self._log(
+                'Storage backend `%s` not available, '
+                'using `pypath` instead.' % backend
+            )
+            backend = 'pypath'
 
-        return os.path.join(
-            self.get_param('tables_dir'),
-            self.get_param('%s_tsv' % dataset),
-        )
+        return backend
 
 
-    def build_dataset(self, dataset):
+    def build_fingerprint(self, dataset):
+        """
+        A short hash of everything which determines the contents of a
+        dataset: the build arguments including the resource definitions,
+        the module level defaults of the pypath module, the pypath
+        version and the build fingerprints of the datasets it depends on.
+        The pickle file names contain this hash, hence a dataset is
+        rebuilt whenever any of its inputs change.
+
+        The result is kept until the settings or the parameters of this
+        object are replaced; the pypath module defaults are expected not
+        to change in place after the first call.
+        """
 
-        self._log('Building dataset `%s`.' % dataset)
+        state = (
+            dataset,
+            tuple(sorted(
+                (key, id(value))
+                for key, value in vars(op2_settings.settings).items()
+            )),
+            tuple(sorted(
+                (key, id(value))
+                for key, value in self.param.items()
+            )),
+        )
 
-        args = self.get_build_args(dataset)
+        if state not in self._build_fingerprints:
 
-        mod = self.ensure_module(dataset)
+            self._build_fingerprints[state] = self._build_fingerprint(
+                dataset
+            )
 
-        db = mod.get_db(**args)
+        return self._build_fingerprints[state]
 
-        pickle_path = self.pickle_path(dataset)
-        self._log('Saving dataset `%s` to `%s`.' % (dataset, pickle_path))
-        db.save_to_pickle(pickle_file = pickle_path)
 
-        self._log('Successfully built dataset `%s`.' % dataset)
+    def _build_fingerprint(self, dataset):
 
-        setattr(self, dataset, db)
+        dependencies = self.dataset_dependencies(dataset)
 
-        self._add_network_df(dataset)
+        inputs = {
+            'dataset': dataset,
+            'args': self.get_build_args(dataset),
+            'module': self.dataset_module(dataset),
+            'pypath': getattr(pypath, '__version__', None),
+            'dependencies': {
+                dep: self.build_fingerprint(dep)
+                for dep in dependencies
+            },
+        }
 
+        if hasattr(self, 'fingerprint_extra_%s' % dataset):
 
-    def ensure_module(self, dataset, reset = True):
+            inputs['extra'] = getattr(
+                self,
+                'fingerprint_extra_%s' % dataset
+            )()
 
-        mod_str = self.get_param('%s_mod' % dataset)
-        mod = sys.modules['pypath.core.%s' % mod_str]
+        return fingerprint.digest(inputs)
 
-        if reset and hasattr(mod, 'db'):
 
-            delattr(mod, 'db')
+    def fingerprint_extra_omnipath(self):
 
-        return mod
+        # the omnipath network is built from the default resource
+        # definitions in the pypath module
+        return {
+            attr: getattr(netres, attr)
+            for attr in dir(netres)
+            if (
+                not attr.startswith('_') and
+                isinstance(getattr(netres, attr), dict)
+            )
+        }
 
 
-    def reload_module(self, dataset):
+    def _module_defaults(self, module):
+        """
+        The module level containers (dicts, sets, lists and tuples) of a
+        pypath module, these are the defaults of the builds without
+        arguments. Containers of objects without stable representation
+        are skipped.
+        """
 
-        mod = self.ensure_module(dataset, reset = False)
-        imp.reload(mod)
+        mod = imp.import_module(module)
+        defaults = {}
 
-        if hasattr(mod, 'db'):
+        for attr in dir(mod):
 
-            mod.db.reload()
+            value = getattr(mod, attr)
 
+            if (
+                attr.startswith('_') or
+                not isinstance(value, (dict, set, frozenset, list, tuple))
+            ):
 
-    def get_build_args(self, dataset):
+                continue
 
-        args = self.get_param('%s_args' % dataset) or {}
+            try:
 
-        if hasattr(self, 'get_args_%s' % dataset):
+                fingerprint.stable_repr(value)
 
-            args.update(getattr(self, 'get_args_%s' % dataset)())
+            except TypeError as e:
 
-        return args
+                self._log(
+                    'Not in the fingerprint: `%s.%s`: %s' % (
+                        module,
+                        attr,
+                        str(e),
+                    )
+                )
+                continue
 
+            defaults[attr] = value
 
-    def load_dataset(self, dataset):
+        return defaults
 
-        pickle_path = self.pickle_path(dataset)
 
-        self._log('Loading dataset `%s` from `%s`.' % (dataset, pickle_path))
+    def fingerprint_extra_complex(self):
 
-        mod = self.ensure_module(dataset)
+        return self._module_defaults('pypath.core.complex')
 
-        setattr(self, dataset, mod.get_db(pickle_file = pickle_path))
 
-        self._log('Loaded dataset `%s` from `%s`.' % (dataset, pickle_path))
+    def fingerprint_extra_enz_sub(self):
 
-        self._add_network_df(dataset)
+        return {
+            'module': self._module_defaults('pypath.core.enz_sub'),
+            'resources': netres.enzyme_substrate,
+        }
 
 
-    def get_args_curated(self):
+    def fingerprint_extra_intercell(self):
 
-        resources = copy.deepcopy(netres.pathway)
-        resources.update(copy.deepcopy(netres.enzyme_substrate))
+        # the category definitions
+        return self._module_defaults('pypath.core.intercell_annot')
 
-        return {'resources': resources}
 
+    def fingerprint_extra_annotations(self):
 
-    def get_args_tf_target(self):
+        return {
+            attr: getattr(annot, attr)
+            for attr in (
+                'protein_sources_default',
+                'complex_sources_default',
+            )
+            if hasattr(annot, attr)
+        }
 
-        transcription = copy.deepcopy(netres.transcription)
-        dorothea = {}
 
-        for level in self.get_param('tfregulons_levels'):
+    def fingerprint(self, dataset):
+        """
+        A stable hash of the contents of a dataset, computed without
+        loading it. Tables, plots and caches derived from the dataset
+        can use it as a key: it changes only if the dataset might have
+        changed.
+
+        It combines the build fingerprint (the parameters), the checksums
+        of the input files from the input manifest, or, if the inputs
+        have not been recorded, the checksum of the pickle, and the
+        fingerprints of the datasets this one depends on. The input
+        checksums are preferred, as the pickles of identical builds are
+        not necessarily identical byte by byte. Views are identified by
+        the fingerprint of their parent and their definition.
+        """
 
-            dorothea['dorothea_%s' % level] = copy.deepcopy(
-                transcription['dorothea']
-            )
-            dorothea['dorothea_%s' % level].name = 'DoRothEA_%s' % level
-            dorothea['dorothea_%s' % level].input_args = {'levels': {level}}
+        if self.is_view(dataset):
 
-        del transcription['dorothea']
-        transcription.update(dorothea)
+            contents = {
+                'parent': self.fingerprint(self.view_param(dataset)['parent']),
+                'view': self.view_param(dataset),
+                'args': self.get_build_args(dataset),
+            }
 
-        return {'resources': transcription}
+        else:
 
+            self.ensure_pickle(dataset)
+            contents = {
+                'build': self.build_fingerprint(dataset),
+                'dependencies': {
+                    dep_dataset: self.fingerprint(dep_dataset)
+                    for dep_dataset in self.dataset_dependencies(dataset)
+                },
+            }
+            inputs = self._input_checksums(dataset)
 
-    def get_args_tf_mirna(self):
+            if inputs:
 
-        return {'resources': netres.tf_mirna}
+                contents['inputs'] = inputs
 
+            else:
 
-    def get_args_mirna_mrna(self):
+                contents['pickle'] = self.pickle_checksum(dataset)
 
-        return {'resources': netres.mirna_target}
+        return fingerprint.digest(contents, length = 32)
 
 
-    def get_args_lncrna_mrna(self):
+    def ensure_pickle(self, dataset):
+        """
+        Builds a dataset if its pickle does not exist or it has to be
+        rebuilt, without loading it otherwise.
+        """
 
-        return {'resources': netres.lncrna_target}
+        if self.client():
 
+            return
 
-    def compile_tables(self):
+        with self._dataset_lock(dataset):
 
-        self.foreach_dataset(method = self.compile_table)
+            if self.needs_rebuild(dataset):
 
+                self.ensure_dataset(dataset, force_rebuild = True)
 
-    def compile_table(self, dataset):
 
-        table_path = self.table_path(dataset)
-        db = self.get_db(dataset)
-        db.update_summaries()
-        db.summaries_tab(outfile = table_path)
+    def _input_checksums(self, dataset):
 
+        if not self.get_param('input_manifest'):
 
-    def foreach_dataset(self, method):
+            return None
 
-        for dataset in self.datasets:
+        manifest = input_bundle.read_manifest(self.input_manifest_path())
 
-            _ = method(dataset)
+        return {
+            rel_path: manifest['files'][rel_path]['sha256']
+            for rel_path in manifest['datasets'].get(dataset, ())
+            if rel_path in manifest['files']
+        }
 
 
-    def get_db(self, dataset):
+    def pickle_checksum(self, dataset):
+        """
+        SHA-256 of the pickle of a dataset. It is stored in a file next to
+        the pickle and computed again only if the size or the modification
+        time of the pickle change.
+        """
 
-        self.ensure_dataset(dataset)
+        pickle_path = self.pickle_path(dataset)
+        checksum_path = '%s.sha256' % pickle_path
+        stat = os.stat(pickle_path)
+        key = [stat.st_size, stat.st_mtime_ns]
 
-        return getattr(self, dataset)
+        if os.path.exists(checksum_path):
 
+            with open(checksum_path, 'r') as fp:
 
-    def remove_db(self, dataset):
+                record = json.load(fp)
 
-        if hasattr(self, dataset):
+            if record['key'] == key:
 
-            delattr(self, dataset)
+                return record['sha256']
 
+        with self._instrument(dataset, 'pickle_checksum'):
 
-    def remove_all(self):
+            checksum = input_bundle.checksum(pickle_path)
 
-        self.foreach_dataset(method = self.ensure_module)
-        self.foreach_dataset(method = self.remove_db)
+        # parallel task workers might compute it at the same time
+        tmp_path = '%s.%u.tmp' % (checksum_path, os.getpid())
 
+        with open(tmp_path, 'w') as fp:
 
-    def get_param(self, key):
+            json.dump({'key': key, 'sha256': checksum}, fp)
 
-        if key in self.param:
+        os.replace(tmp_path, checksum_path)
 
-            return self.param[key]
+        return checksum
 
-        return op2_settings.get(key)
 
+    def remove_superseded_pickles(self, dataset):
+        """
+        Removes the pickles of a dataset with other build fingerprints
+        than the current one, together with their checksums, network data
+        frame caches and snapshots. Only if the ``pickle_fingerprint`` and
+        ``pickle_remove_superseded`` settings are True.
+        """
 
-    def _create_network_df(self, dataset = 'omnipath', **kwargs):
+        if not (
+            self.get_param('pickle_fingerprint') and
+            self.get_param('pickle_remove_superseded')
+        ):
 
-        graph = self.get_db(dataset)
+            return
 
-        return self._network_df(graph, **kwargs)
+        stem = os.path.splitext(self.get_param('%s_pickle' % dataset))[0]
+        current = '%s__%s' % (stem, self.build_fingerprint(dataset))
+        base = os.path.join(
+            self.get_param('pickle_dir'),
+            '%s__%s' % (stem, '[0-9a-f]' * len(current[len(stem) + 2:])),
+        )
 
-    def network_df(self, dataset, by_source = False):
+        for path in glob.glob('%s.*' % base) + glob.glob('%s__*' % base):
 
-        self.ensure_dataset(dataset)
+            if os.path.basename(path).startswith(current):
 
-        by_source_str = 'by_source' if by_source else 'plain'
+                continue
 
-        return self.network_dfs[dataset][by_source_str]
+            self._log(
+                'Removing superseded file of dataset `%s`: `%s`.' % (
+                    dataset,
+                    path,
+                )
+            )
 
+            with contextlib.suppress(FileNotFoundError):
 
-    def network_df_by_source(self, dataset = 'omnipath'):
+                os.remove(path)
 
-        self.ensure_dataset(dataset)
 
-        return self.network_dfs[dataset]['by_source']
+    def pickle_exists(self, dataset):
 
+        return os.path.exists(self.pickle_path(dataset))
 
-    def _network_df(self, obj, **kwargs):
 
-        if not isinstance(obj, network.Network):
+    def table_path(self, dataset):
 
-            obj = network.Network.from_igraph(obj)
+        return os.path.join(
+            self.get_param('tables_dir'),
+            self.get_param('%s_tsv' % dataset),
+        )
 
-        obj.make_df(**kwargs)
 
-        return obj.df
+    def build_dataset(self, dataset):
 
+        if self.get_param('build_isolated'):
 
-    def _add_network_df(self, dataset):
+            self._build_isolated(dataset)
+            self._built.add(dataset)
+            self.write_input_manifest()
+            self.load_dataset(dataset)
 
-        obj = getattr(self, dataset)
+        else:
 
-        if (
-            (
-                hasattr(obj, 'graph') and
-                isinstance(obj.graph, main.igraph.Graph)
-            ) or
-            isinstance(obj, network.Network)
-        ):
+            db = self._build_and_save(dataset)
+            self._built.add(dataset)
+            self.write_input_manifest()
 
-            network_df = self._network_df(obj, by_source = False)
-            network_df_by_source = self._network_df(obj, by_source = True)
+            setattr(self, dataset, db)
 
-            self.network_dfs[dataset] = {}
-            self.network_dfs[dataset]['plain'] = network_df
-            self.network_dfs[dataset]['by_source'] = network_df_by_source
+            self._add_network_df(dataset)
+            self._register_resident(
+                dataset,
+                'db',
+                self._estimate_size(dataset),
+            )
 
-            self._log('Created network data frames for `%s`.' % dataset)
+        if self.get_param('snapshots') and lazy.available('pyarrow'):
 
+            self.export_snapshot(dataset)
 
-    def set_network(self, dataset, by_source = False, **kwargs):
+
+    def _build_isolated(self, dataset):
         """
-        Sets dataset as the default
+        Builds a dataset in a child process which saves the pickle and
+        exits, so the memory used by the build is returned to the system.
+        The child is killed if its own memory, not counting the pages
+        shared with the parent after the fork, exceeds ``build_max_rss``
+        (in GB).
         """
 
-        network_df = self.network_df(dataset, by_source = by_source, **kwargs)
+        max_rss = self.get_param('build_max_rss')
+        max_rss = max_rss * 1024 ** 3 if max_rss else None
+        recv_conn, send_conn = multiprocessing.Pipe(duplex = False)
+        proc = multiprocessing.Process(
+            target = _isolated_build_worker,
+            args = (send_conn, dataset, self._worker_param()),
+            name = 'op2-build-%s' % dataset,
+        )
+        proc.start()
+        send_conn.close()
+
+        self._log(
+            'Building dataset `%s` in process %u%s.' % (
+                dataset,
+                proc.pid,
+                ', RSS limit %.01f GB' % (max_rss / 1024 ** 3)
+                    if max_rss else
+                '',
+            )
+        )
+
+        result = None
+        peak_rss = 0
+
+        while result is None:
+
+            if recv_conn.poll(.5):
+
+                try:
+
+                    result = recv_conn.recv()
+
+                except EOFError:
+
+                    break
+
+            elif not proc.is_alive():
+
+                break
+
+            rss = _process_memory(proc.pid) or 0
+            peak_rss = max(peak_rss, rss)
+
+            if max_rss and rss > max_rss:
+
+                proc.kill()
+                proc.join()
+
+                raise RuntimeError(
+                    'Building dataset `%s` killed: its memory '
+                    '%.01f GB exceeded the limit of %.01f GB.' % (
+                        dataset,
+                        rss / 1024 ** 3,
+                        max_rss / 1024 ** 3,
+                    )
+                )
+
+        proc.join()
+        recv_conn.close()
+
+        if result is None:
+
+            raise RuntimeError(
+                'Building dataset `%s`: process exited with code %s.' % (
+                    dataset,
+                    proc.exitcode,
+                )
+            )
+
+        status, value = result
+
+        if status == 'error':
+
+            raise RuntimeError(
+                'Building dataset `%s` failed in process %u:\n%s' % (
+                    dataset,
+                    proc.pid,
+                    value,
+                )
+            )
+
+        pickle_path, stats = value
+        self.merge_stats(stats)
+
+        self._log(
+            'Dataset `%s` has been built in a separate process and saved '
+            'to `%s`, peak memory of the build: %.01f GB.' % (
+                dataset,
+                pickle_path,
+                peak_rss / 1024 ** 3,
+            )
+        )
+
+
+    def input_cache(self):
+        """
+        The cache of the parsed inputs, shared by the builds of all
+        datasets in this process and, within ``build``, by a directory
+        with the build worker processes.
+        """
+
+        if self._input_cache is None:
+
+            self._input_cache = input_cache_mod.InputCache(
+                max_size = self.get_param('input_cache_size'),
+                shared_dir = (
+                    self._input_cache_dir or
+                    self.get_param('input_cache_dir')
+                ),
+                max_shared_size = self.get_param('input_cache_shared_size'),
+            )
+
+        return self._input_cache
+
+
+    def close_input_cache(self):
+        """
+        Empties the input cache and removes its shared directory if it's
+        owned by this instance (i.e. this is not a build worker).
+        """
+
+        if self._input_cache:
+
+            self._input_cache.clear()
+            self._input_cache = None
+
+        if self._input_cache_dir:
+
+            shutil.rmtree(self._input_cache_dir, ignore_errors = True)
+            self._input_cache_dir = None
+
+
+    def input_cache_session(self):
+        """
+        Context which enables the input cache if the ``input_cache``
+        setting is True.
+        """
+
+        return (
+            self.input_cache().session()
+                if self.get_param('input_cache') else
+            contextlib.nullcontext()
+        )
+
+
+    @contextlib.contextmanager
+    def _record_inputs(self, dataset):
+        """
+        Records the input files used by the build of a dataset if the
+        ``input_manifest`` setting is not None.
+        """
+
+        if not self.get_param('input_manifest'):
+
+            yield
+            return
+
+        # the other workers download into the same cache directory,
+        # in their case only the downloads of this process are recorded
+        recorder = input_bundle.InputRecorder(
+            scan = (
+                bool(self.get_param('input_manifest_scan')) and
+                not self.get_param('parallel_worker')
+            ),
+        )
+
+        with recorder.session():
+
+            yield
+
+        self._dataset_stats(dataset)['inputs'] = sorted(recorder.files)
+
+
+    def input_manifest_path(self):
+
+        return os.path.join(
+            self.get_param('pickle_dir'),
+            self.get_param('input_manifest'),
+        )
+
+
+    def write_input_manifest(self):
+        """
+        Adds the input files recorded in the builds to the manifest.
+        ``python -m omnipath2.input_bundle pack`` creates a bundle of
+        these files to prepare the builds on offline machines.
+        """
+
+        with self._state_lock:
+
+            inputs = {
+                dataset: dataset_stats['inputs']
+                for dataset, dataset_stats in self.stats.items()
+                if dataset_stats.get('inputs')
+            }
+
+        if inputs and self.get_param('input_manifest'):
+
+            input_bundle.update_manifest(self.input_manifest_path(), inputs)
+
+
+    def is_view(self, dataset):
+        """
+        Tells if a dataset is declared as a view of another dataset in
+        the ``dataset_views`` setting.
+        """
+
+        return dataset in (self.get_param('dataset_views') or {})
+
+
+    def view_param(self, dataset):
+
+        return self.get_param('dataset_views')[dataset]
+
+
+    def build_view(self, dataset):
+        """
+        Creates a network dataset in memory from its parent network by
+        keeping only the evidences from certain resources and/or the
+        evidences accepted by a filter method. Views are not saved to
+        pickles, they are created again each time they are loaded.
+
+        The views are defined in the ``dataset_views`` setting, e.g.
+        ``{'curated': {'parent': 'omnipath'}}``. The optional keys are
+        ``resources``, a set of resource names (by default the resources
+        from the build arguments of the view dataset, if any), and
+        ``filter``, the name of a method ``view_filter_<filter>`` of this
+        class which receives an evidence and the view definition, and
+        returns a bool.
+        """
+
+        param = self.view_param(dataset)
+        parent = param['parent']
+
+        self._log(
+            'Creating dataset `%s` as a view of `%s`.' % (dataset, parent)
+        )
+
+        resources = param.get('resources')
+
+        if resources is None:
+
+            resources = {
+                res.name
+                for res in (
+                    self.get_build_args(dataset).get('resources') or {}
+                ).values()
+            }
+
+        evidence_filter = (
+            getattr(self, 'view_filter_%s' % param['filter'])
+                if param.get('filter') else
+            None
+        )
+
+        def keep(evidence):
+
+            return (
+                (not resources or evidence.resource.name in resources) and
+                (not evidence_filter or evidence_filter(evidence, param))
+            )
+
+        with self._instrument(dataset, 'view'):
+
+            db = self._filter_network(self.get_db(parent), keep)
+
+        self._entity_codes.pop(dataset, None)
+        setattr(self, dataset, db)
+
+        self._add_network_df(dataset)
+        self._register_resident(dataset, 'db', self._estimate_size(parent))
+
+        self._log(
+            'Created view `%s` of `%s`: %u interactions.' % (
+                dataset,
+                parent,
+                len(db.interactions),
+            )
+        )
+
+
+    @staticmethod
+    def view_filter_dorothea_levels(evidence, param):
+        """
+        Keeps the DoRothEA evidences of the confidence levels in the
+        ``levels`` of the view definition, and all other evidences.
+        """
+
+        if not evidence.resource.name.startswith('DoRothEA'):
+
+            return True
+
+        attrs = getattr(evidence, 'attrs', None) or {}
+        levels = attrs.get('dorothea_level', attrs.get('tfregulons_level'))
+
+        return bool(common.to_set(levels) & set(param['levels']))
+
+
+    @staticmethod
+    def _filter_network(parent_db, keep):
+        """
+        Creates a new network from the interactions of another one,
+        keeping only the evidences accepted by ``keep``. Interactions left
+        without evidences are not added. The evidence objects are shared
+        with the parent network, they must not be modified.
+        """
+
+        db = network.Network(
+            ncbi_tax_id = parent_db.ncbi_tax_id,
+            allow_loops = parent_db.allow_loops,
+        )
+
+        def filtered(evidences):
+
+            evidences = copy.copy(evidences)
+            evidences.evidences = dict(
+                (res, ev)
+                for res, ev in evidences.evidences.items()
+                if keep(ev)
+            )
+
+            return evidences
+
+        for interaction in parent_db.interactions.values():
+
+            evidences = filtered(interaction.evidences)
+
+            if not evidences.evidences:
+
+                continue
+
+            interaction = copy.copy(interaction)
+            interaction.evidences = evidences
+
+            for attr in ('direction', 'positive', 'negative'):
+
+                setattr(
+                    interaction,
+                    attr,
+                    dict(
+                        (key, filtered(_evidences))
+                        for key, _evidences in
+                        getattr(interaction, attr).items()
+                    ),
+                )
+
+            db.add_interaction(interaction)
+
+        return db
+
+
+    def _build_and_save(self, dataset):
+        """
+        Builds a dataset and saves it to its pickle without keeping a
+        reference to it.
+        """
+
+        self._log('Building dataset `%s`.' % dataset)
+
+        args = self.get_build_args(dataset)
+
+        with self._module_lock(dataset):
+
+            mod = self.ensure_module(dataset)
+
+            with self.input_cache_session(), self._record_inputs(dataset):
+
+                with self._instrument(dataset, 'build'):
+
+                    db = mod.get_db(**args)
+
+        pickle_path = self.pickle_path(dataset)
+        self._log('Saving dataset `%s` to `%s`.' % (dataset, pickle_path))
+
+        with self._instrument(dataset, 'save'):
+
+            self.save_db(db, pickle_path)
+
+        self._record_pickle_size(dataset)
+        # the data frames from the previous pickle are not valid any more
+        self.remove_network_df_cache(dataset)
+        self.remove_superseded_pickles(dataset)
+
+        self._log('Successfully built dataset `%s`.' % dataset)
+
+        return db
+
+
+    def dataset_module(self, dataset):
+        """
+        Name of the pypath module of a dataset; for views the module of
+        their parent.
+        """
+
+        while self.is_view(dataset):
+
+            dataset = self.view_param(dataset)['parent']
+
+        return self.get_param('%s_mod' % dataset)
+
+
+    def ensure_module(self, dataset, reset = True):
+
+        mod_str = self.dataset_module(dataset)
+        mod = imp.import_module('pypath.core.%s' % mod_str)
+
+        if reset and hasattr(mod, 'db'):
+
+            delattr(mod, 'db')
+
+        return mod
+
+
+    def reload_module(self, dataset):
+
+        mod = self.ensure_module(dataset, reset = False)
+        imp.reload(mod)
+
+        if hasattr(mod, 'db'):
+
+            mod.db.reload()
+
+
+    def get_build_args(self, dataset):
+
+        args = dict(self.get_param('%s_args' % dataset) or {})
+
+        if hasattr(self, 'get_args_%s' % dataset):
+
+            args.update(getattr(self, 'get_args_%s' % dataset)())
+
+        return args
+
+
+    def load_dataset(self, dataset):
+
+        pickle_path = self.pickle_path(dataset)
+
+        self._log('Loading dataset `%s` from `%s`.' % (dataset, pickle_path))
+
+        with self._instrument(dataset, 'load'):
+
+            setattr(self, dataset, self.read_db(dataset, pickle_path))
+
+        self._entity_codes.pop(dataset, None)
+
+        self._record_pickle_size(dataset)
+
+        self._log('Loaded dataset `%s` from `%s`.' % (dataset, pickle_path))
+
+        self._add_network_df(dataset)
+        self._register_resident(dataset, 'db', self._estimate_size(dataset))
+
+
+    def save_db(self, db, path, backend = None):
+        """
+        Saves a dataset object by the storage backend.
+        """
+
+        backend = backend or self.storage_backend()
+
+        if backend == 'pypath':
+
+            db.save_to_pickle(pickle_file = path)
+
+        else:
+
+            storage.save(
+                db,
+                path,
+                backend = backend,
+                threads = self.get_param('storage_threads'),
+            )
+
+
+    def read_db(self, dataset, path, backend = None):
+        """
+        Reads a dataset object by the storage backend and sets it as the
+        module level database in its pypath module.
+        """
+
+        backend = backend or self.storage_backend()
+
+        with self._module_lock(dataset):
+
+            mod = self.ensure_module(dataset)
+
+            if backend == 'pypath':
+
+                return mod.get_db(pickle_file = path)
+
+            mod.db = storage.load(path, backend = backend)
+
+            return mod.db
+
+
+    @contextlib.contextmanager
+    def _instrument(self, dataset, step):
+        """
+        Records the wall time, the CPU time of the current thread and the
+        peak resident memory of a step of processing a dataset, above the
+        resident memory at the start of the step. Steps running in other
+        threads at the same time contribute to the peak.
+        """
+
+        wall0 = time.time()
+        cpu0 = time.thread_time()
+        peak_token, rss0 = profiling.peak_start()
+
+        try:
+
+            yield
+
+        finally:
+
+            maxrss1 = profiling.peak_stop(peak_token)
+
+        record = {
+            'step': step,
+            'wall_s': round(time.time() - wall0, 3),
+            'cpu_s': round(time.thread_time() - cpu0, 3),
+            'maxrss_delta_mb': (
+                round((maxrss1 - rss0) / 1024 ** 2, 1)
+                    if maxrss1 is not None and rss0 is not None else
+                None
+            ),
+        }
+
+        self._dataset_stats(dataset)['steps'].append(record)
+
+
+    def _dataset_stats(self, dataset):
+
+        with self._state_lock:
+
+            return self.stats.setdefault(
+                dataset,
+                {'pickle_size': None, 'steps': []},
+            )
+
+
+    def _record_pickle_size(self, dataset):
+
+        pickle_path = self.pickle_path(dataset)
+
+        if os.path.exists(pickle_path):
+
+            self._dataset_stats(dataset)['pickle_size'] = (
+                os.path.getsize(pickle_path)
+            )
+
+
+    def merge_stats(self, stats):
+        """
+        Adds records from another ``Database`` instance, e.g. from
+        a build worker process.
+        """
+
+        for dataset, dataset_stats in stats.items():
+
+            _dataset_stats = self._dataset_stats(dataset)
+
+            with self._state_lock:
+
+                _dataset_stats['steps'].extend(dataset_stats['steps'])
+
+            if 'inputs' in dataset_stats:
+
+                _dataset_stats['inputs'] = dataset_stats['inputs']
+
+            _dataset_stats['pickle_size'] = (
+                dataset_stats['pickle_size'] or
+                _dataset_stats['pickle_size']
+            )
+
+
+    def stats_path(self):
+
+        tables_dir = (
+            getattr(self, 'tables_dir', None) or
+            self.get_param('tables_dir')
+        )
+
+        return os.path.join(
+            tables_dir,
+            '%s__%s.json' % (self.get_param('dataset_stats'), self.timestamp),
+        )
+
+
+    def write_stats(self, path = None):
+        """
+        Writes the time, memory and file size records of the datasets
+        to a JSON file in the tables directory and logs a summary.
+        """
+
+        path = path or self.stats_path()
+
+        with open(path, 'w') as fp:
+
+            json.dump(self.stats, fp, sort_keys = True, indent = 4)
+
+        self._log('Dataset statistics written to `%s`.' % path)
+        self.log_stats()
+
+
+    def log_stats(self):
+
+        with self._state_lock:
+
+            stats = sorted(self.stats.items())
+
+        for dataset, dataset_stats in stats:
+
+            steps = collections.defaultdict(lambda: [0., 0., 0.])
+
+            for record in dataset_stats['steps']:
+
+                steps[record['step']][0] += record['wall_s']
+                steps[record['step']][1] += record['cpu_s']
+                steps[record['step']][2] = max(
+                    steps[record['step']][2],
+                    record['maxrss_delta_mb'] or 0.,
+                )
+
+            self._log(
+                'Dataset `%s`: pickle size %s; %s.' % (
+                    dataset,
+                    (
+                        '%.01f MB' % (dataset_stats['pickle_size'] / 1024 ** 2)
+                            if dataset_stats['pickle_size'] else
+                        'n/a'
+                    ),
+                    '; '.join(
+                        '%s: %.01fs wall, %.01fs CPU, +%.01f MB peak RSS' % (
+                            (step,) + tuple(values)
+                        )
+                        for step, values in steps.items()
+                    ),
+                )
+            )
+
+
+    def get_args_curated(self):
+
+        resources = copy.deepcopy(netres.pathway)
+        resources.update(copy.deepcopy(netres.enzyme_substrate))
+
+        return {'resources': resources}
+
+
+    def get_args_tf_target(self):
+
+        # DoRothEA is read once with all levels, the levels are kept in
+        # the evidences, see ``view_filter_dorothea_levels``
+        transcription = copy.copy(netres.transcription)
+        transcription['dorothea'] = copy.copy(transcription['dorothea'])
+        transcription['dorothea'].input_args = {
+            'levels': set(self.get_param('tfregulons_levels')),
+        }
+
+        return {'resources': transcription}
+
+
+    def get_args_tf_mirna(self):
+
+        return {'resources': netres.tf_mirna}
+
+
+    def get_args_mirna_mrna(self):
+
+        return {'resources': netres.mirna_target}
+
+
+    def get_args_lncrna_mrna(self):
+
+        return {'resources': netres.lncrna_target}
+
+
+    def compile_tables(self):
+
+        self.foreach_dataset(method = self.compile_table)
+
+
+    def compile_table(self, dataset):
+
+        table_path = self.table_path(dataset)
+        db = self.get_db(dataset)
+        db.update_summaries()
+        db.summaries_tab(outfile = table_path)
+
+
+    def foreach_dataset(self, method):
+
+        for dataset in self.datasets:
+
+            _ = method(dataset)
+
+
+    def get_db(self, dataset):
+
+        self._record_access(dataset)
+
+        if self.client():
+
+            return self.server.get_db(dataset)
+
+        self.ensure_dataset(dataset)
+
+        return getattr(self, dataset)
+
+
+    @contextlib.contextmanager
+    def record_access(self):
+        """
+        Collects the names of the datasets accessed by ``get_db``,
+        ``network_df`` and the like within a ``with`` block.
+        """
+
+        accessed = set()
+
+        with self._state_lock:
+
+            self._access_records.append(accessed)
+
+        try:
+
+            yield accessed
+
+        finally:
+
+            with self._state_lock:
+
+                self._access_records = [
+                    _accessed
+                    for _accessed in self._access_records
+                    if _accessed is not accessed
+                ]
+
+
+    def _record_access(self, dataset):
+
+        with self._state_lock:
+
+            for accessed in self._access_records:
+
+                accessed.add(dataset)
+
+
+    def connect(self, address = None, authkey = None):
+        """
+        Connects to a dataset server (see ``omnipath2.server``). After
+        this the datasets and network data frames are served from the
+        server instead of being loaded in this process.
+        """
+
+        self.server = server_mod.DatasetClient(
+            address = address,
+            authkey = authkey,
+        )
+
+
+    def disconnect(self):
+
+        self.server = None
+
+
+    def client(self):
+        """
+        The dataset server client, if connected or if the
+        ``dataset_server`` setting is True.
+        """
+
+        if self.server is None and self.get_param('dataset_server'):
+
+            self.connect()
+
+        return self.server
+
+
+    def remove_db(self, dataset):
+
+        if hasattr(self, dataset):
+
+            delattr(self, dataset)
+
+        with self._state_lock:
+
+            self._resident.pop(dataset, None)
+
+        self._entity_codes.pop(dataset, None)
+
+
+    def entity_codes(self, dataset, method = 'get_identifiers', **kwargs):
+        """
+        Calls a method of a dataset which returns a set of entities, and
+        returns them as an array of codes from the ``entity_index``. The
+        result is kept until the dataset is removed from the memory.
+
+        dataset : str
+            Name of the dataset.
+        method : str
+            Name of the method of the dataset object.
+        kwargs :
+            Passed to the method.
+        """
+
+        key = (method, fingerprint.stable_repr(kwargs))
+        codes = self._entity_codes.setdefault(dataset, {})
+
+        if key not in codes:
+
+            entities = getattr(self.get_db(dataset), method)(**kwargs)
+            codes[key] = self.entity_index.encode(entities)
+
+        return codes[key]
+
+
+    def evict(self, dataset):
+        """
+        Removes a dataset and its network data frames from the memory.
+        Next time it will be loaded again from the pickle.
+        """
+
+        size = self.resident_size(dataset)
+
+        with self._module_lock(dataset):
+
+            mod = self.ensure_module(dataset, reset = False)
+
+            if getattr(mod, 'db', None) is getattr(self, dataset, None):
+
+                delattr(mod, 'db')
+
+        self.remove_db(dataset)
+        self.network_dfs.pop(dataset, None)
+
+        self._log(
+            'Evicted dataset `%s` from the memory (%.02f GB).' % (
+                dataset,
+                size / 1024 ** 3,
+            )
+        )
+
+
+    def resident_size(self, dataset = None):
+        """
+        Estimated memory use of one or all loaded datasets in bytes.
+        """
+
+        with self._state_lock:
+
+            return sum(
+                sum(sizes.values())
+                for _dataset, sizes in self._resident.items()
+                if dataset is None or _dataset == dataset
+            )
+
+
+    def _touch(self, dataset):
+
+        with self._state_lock:
+
+            if dataset in self._resident:
+
+                self._resident.move_to_end(dataset)
+
+
+    def _register_resident(self, dataset, component, size):
+
+        with self._state_lock:
+
+            self._resident.setdefault(dataset, {})[component] = size
+            self._resident.move_to_end(dataset)
+
+        self._enforce_memory_budget(keep = dataset)
+
+
+    @contextlib.contextmanager
+    def protect(self, datasets):
+        """
+        Within a ``with`` block, the datasets (and the ones they depend
+        on) are not evicted to fit into the memory budget, e.g. while
+        a job is using them and other datasets are prefetched.
+        """
+
+        datasets = [d for d in common.to_list(datasets) if d]
+
+        with self._state_lock:
+
+            self._protected.append(datasets)
+
+        try:
+
+            yield
+
+        finally:
+
+            with self._state_lock:
+
+                self._protected = [
+                    _datasets
+                    for _datasets in self._protected
+                    if _datasets is not datasets
+                ]
+
+
+    def _estimate_size(self, dataset):
+        """
+        Estimates the memory use of a loaded dataset from the size of its
+        pickle multiplied by the ``memory_pickle_factor`` setting of the
+        storage backend.
+        """
+
+        pickle_path = self.pickle_path(dataset)
+
+        if not os.path.exists(pickle_path):
+
+            return 0
+
+        factor = self.get_param('memory_pickle_factor')
+
+        if isinstance(factor, dict):
+
+            factor = factor.get(self.storage_backend(), 4.)
+
+        return os.path.getsize(pickle_path) * factor
+
+
+    def _enforce_memory_budget(self, keep = None):
+        """
+        Evicts the least recently used datasets until the estimated
+        memory use fits into the ``memory_budget`` (in GB). Datasets
+        required by ``keep`` or by other loaded datasets are not evicted.
+        """
+
+        budget = self.get_param('memory_budget')
+
+        if not budget:
+
+            return
+
+        budget = budget * 1024 ** 3
+
+        with self._state_lock:
+
+            resident = list(self._resident.keys())
+            # the datasets of the running jobs, and the ones they
+            # accessed so far
+            keep = set(common.to_list(keep)) if keep else set()
+            keep.update(itertools.chain(*self._protected))
+            keep.update(itertools.chain(*self._access_records))
+
+        protected = set(self.dataset_closure(keep)) if keep else set()
+
+        for dataset in resident:
+
+            if self.resident_size() <= budget:
+
+                break
+
+            required = any(
+                dataset in self.dataset_dependencies(other)
+                for other in resident
+            )
+
+            if dataset in protected or required:
+
+                continue
+
+            lock = self._dataset_lock(dataset)
+
+            # datasets being loaded in another thread are skipped
+            if lock.acquire(blocking = False):
+
+                try:
+
+                    self.evict(dataset)
+
+                finally:
+
+                    lock.release()
+
+
+    def remove_all(self):
+
+        self.foreach_dataset(method = self.ensure_module)
+        self.foreach_dataset(method = self.remove_db)
+
+
+    def get_param(self, key):
+
+        if key in self.param:
+
+            return self.param[key]
+
+        return op2_settings.get(key)
+
+
+    def _create_network_df(self, dataset = 'omnipath', **kwargs):
+
+        graph = self.get_db(dataset)
+
+        return self._network_df(graph, **kwargs)
+
+
+    def network_df(self, dataset, by_source = False):
+        """
+        Returns a network data frame, either the plain or the by source
+        variant. Each variant is created at its first access and kept
+        until ``drop_network_df`` is called.
+        """
+
+        self._record_access(dataset)
+
+        if self.client():
+
+            return self.server.network_df(dataset, by_source = by_source)
+
+        self.ensure_dataset(dataset)
+
+        variant = self._network_df_variant(by_source)
+        network_dfs = self.network_dfs[dataset]
+
+        if variant not in network_dfs and self.out_of_core(dataset):
+
+            self._log(
+                'Network data frame of `%s` is out of core, reading all '
+                'of its chunks into memory; `iter_network_df` processes '
+                'them one by one.' % dataset
+            )
+
+            df = pd.concat(
+                self.iter_network_df(dataset, by_source = by_source),
+                ignore_index = True,
+            )
+            network_dfs[variant] = df
+            self._register_resident(
+                dataset,
+                variant,
+                df.memory_usage(deep = True).sum(),
+            )
+
+        if variant not in network_dfs:
+
+            with self._instrument(dataset, 'network_df_cache_%s' % variant):
+
+                df = self._read_network_df_cache(dataset, variant)
+
+            if df is None and not by_source:
+
+                df = self._derive_plain_network_df(dataset)
+
+            if df is None:
+
+                with self._instrument(dataset, 'network_df_%s' % variant):
+
+                    df = self._create_network_df(
+                        dataset,
+                        by_source = by_source,
+                    )
+
+                self._log(
+                    'Created `%s` network data frame for `%s`.' % (
+                        variant,
+                        dataset,
+                    )
+                )
+
+                self._write_network_df_cache(dataset, variant, df)
+
+            network_dfs[variant] = df
+            self._register_resident(
+                dataset,
+                variant,
+                df.memory_usage(deep = True).sum(),
+            )
+
+        return network_dfs[variant]
+
+
+    def _derive_plain_network_df(self, dataset):
+        """
+        Creates the plain network data frame from the by source one by
+        aggregating the resources and references of the same interaction,
+        so the network objects are iterated only once. Only if the
+        ``network_df_single_pass`` setting is True; the by source data
+        frame is created first if it's not available yet.
+        """
+
+        if not self.get_param('network_df_single_pass'):
+
+            return None
+
+        by_source_df = self.network_df(dataset, by_source = True)
+
+        with self._instrument(dataset, 'network_df_plain_derived'):
+
+            try:
+
+                df = self._plain_from_by_source(by_source_df)
+
+            except (TypeError, ValueError, KeyError) as e:
+
+                self._log(
+                    'Could not derive the plain network data frame '
+                    'for `%s`, creating it from the network: %s' % (
+                        dataset,
+                        str(e),
+                    )
+                )
+
+                return None
+
+        self._log(
+            'Created `plain` network data frame for `%s` from the '
+            '`by_source` one.' % dataset
+        )
+
+        return df
+
+
+    @staticmethod
+    def _plain_from_by_source(
+            df,
+            set_columns = ('dmodel', 'sources', 'references'),
+            none_if_empty = ('references',),
+        ):
+        """
+        Aggregates a by source network data frame into a plain one: one
+        row for each unique combination of the other columns, with the
+        sets of values from the ``set_columns``. In the ``none_if_empty``
+        columns None stands for the empty sets, as in the plain data
+        frames created from the networks.
+        """
+
+        set_columns = [col for col in set_columns if col in df.columns]
+
+        if not set_columns:
+
+            raise KeyError('None of the columns to aggregate is present.')
+
+        # sets of categories can not be aggregated
+        categories = [
+            col
+            for col in df.columns
+            if df[col].dtype.name == 'category'
+        ]
+        df = df.astype({col: object for col in categories})
+        key = [col for col in df.columns if col not in set_columns]
+
+        plain = df[key].drop_duplicates().reset_index(drop = True)
+
+        for col in set_columns:
+
+            empty_none = col in none_if_empty
+            values = df[key + [col]].explode(col).dropna(subset = [col])
+            values = values.groupby(
+                key,
+                sort = False,
+                dropna = False,
+            )[col].agg(set).reset_index()
+            plain = plain.merge(values, on = key, how = 'left')
+            plain[col] = [
+                val if isinstance(val, set) and val else
+                None if empty_none else
+                set()
+                for val in plain[col]
+            ]
+
+        plain = plain.astype({
+            col: 'category'
+            for col in categories
+            if col in key
+        })
+
+        return plain[list(df.columns)]
+
+
+    def network_df_by_source(self, dataset = 'omnipath'):
+
+        return self.network_df(dataset, by_source = True)
+
+
+    def out_of_core(self, dataset):
+        """
+        Tells if the network data frames of a dataset are stored on the
+        disk in chunks instead of being kept in memory.
+        """
+
+        return dataset in (self.get_param('network_df_out_of_core') or ())
+
+
+    def iter_network_df(self, dataset, by_source = False, columns = None):
+        """
+        Iterates over a network data frame in chunks. For out of core
+        datasets the chunks are read from the disk one by one, otherwise
+        the whole data frame is yielded at once.
+
+        dataset : str
+            Name of a network dataset.
+        by_source : bool
+            The by source or the plain variant.
+        columns : list
+            Only these columns.
+        """
+
+        if not self.out_of_core(dataset):
+
+            df = self.network_df(dataset, by_source = by_source)
+
+            yield df[columns] if columns else df
+
+            return
+
+        self._record_access(dataset)
+        path = self._ensure_network_df_chunks(dataset, by_source)
+
+        for df in chunked.read(path, columns = columns):
+
+            yield df
+
+
+    def network_df_chunks_path(self, dataset, variant):
+
+        path = self.network_df_cache_path(dataset, variant)
+
+        return (
+            '%s.chunks.parquet' % os.path.splitext(path)[0]
+                if path else
+            None
+        )
+
+
+    def _ensure_network_df_chunks(self, dataset, by_source):
+        """
+        Writes the chunks of a network data frame if they don't exist
+        yet. The dataset is loaded only in this case.
+        """
+
+        variant = self._network_df_variant(by_source)
+
+        with self._dataset_lock(dataset):
+
+            path = self.network_df_chunks_path(dataset, variant)
+
+            if not path or not os.path.exists(path):
+
+                # the path depends on the pickle, which might not exist yet
+                self.ensure_dataset(dataset)
+                path = self.network_df_chunks_path(dataset, variant)
+
+                with self._instrument(
+                    dataset,
+                    'network_df_chunks_%s' % variant,
+                ):
+
+                    chunked.write(
+                        self._generate_network_df_chunks(dataset, by_source),
+                        path,
+                    )
+
+        return path
+
+
+    def _generate_network_df_chunks(self, dataset, by_source):
+        """
+        Creates the network data frame in chunks of
+        ``network_df_chunk_size`` records.
+        """
+
+        obj = self.get_db(dataset)
+
+        if not isinstance(obj, network.Network):
+
+            obj = network.Network.from_igraph(obj)
+
+        records = obj.generate_df_records(by_source = by_source)
+        chunk_size = self.get_param('network_df_chunk_size')
+
+        while True:
+
+            chunk = list(itertools.islice(records, chunk_size))
+
+            if not chunk:
+
+                break
+
+            obj.make_df(records = chunk, by_source = by_source)
+
+            yield obj.df
+
+        obj.df = None
+
+
+    def drop_network_df(self, dataset = None, by_source = None):
+        """
+        Removes memoized network data frames. By default drops both
+        variants for all datasets, they will be created again at the next
+        access.
+        """
+
+        with self._state_lock:
+
+            datasets = (
+                common.to_list(dataset)
+                    if dataset else
+                list(self.network_dfs.keys())
+            )
+        variants = (
+            ('plain', 'by_source')
+                if by_source is None else
+            (self._network_df_variant(by_source),)
+        )
+
+        for _dataset, variant in itertools.product(datasets, variants):
+
+            with self._state_lock:
+
+                network_dfs = self.network_dfs.get(_dataset, {})
+                self._resident.get(_dataset, {}).pop(variant, None)
+
+            if network_dfs.pop(variant, None) is not None:
+
+                self._log(
+                    'Dropped `%s` network data frame of `%s`.' % (
+                        variant,
+                        _dataset,
+                    )
+                )
+
+
+    @staticmethod
+    def _network_df_variant(by_source):
+
+        return 'by_source' if by_source else 'plain'
+
+
+    def network_df_cache_path(self, dataset, variant):
+        """
+        Path to the columnar file of a network data frame. The file name
+        contains a key derived from the size and modification time of the
+        dataset pickle (for views the pickle of the parent), hence a
+        rebuilt pickle invalidates the cache.
+        """
+
+        pickle_path = self._cache_pickle_path(dataset)
+
+        if not os.path.exists(pickle_path):
+
+            return None
+
+        stat = os.stat(pickle_path)
+        key = hashlib.md5(
+            ('%u:%u' % (stat.st_size, stat.st_mtime_ns)).encode('ascii')
+        ).hexdigest()[:12]
+
+        return '%s__%s__%s.%s' % (
+            self._cache_prefix(dataset),
+            variant,
+            key,
+            self.get_param('network_df_cache_format'),
+        )
+
+
+    def snapshot_path(self, dataset):
+
+        return '%s.arrow' % self._cache_prefix(dataset)
+
+
+    def snapshot_valid(self, dataset):
+        """
+        Tells if the snapshot of a dataset exists and is not older than
+        its pickle.
+        """
+
+        path = self.snapshot_path(dataset)
+        pickle_path = self._cache_pickle_path(dataset)
+
+        return (
+            os.path.exists(path) and (
+                not os.path.exists(pickle_path) or
+                os.path.getmtime(path) >= os.path.getmtime(pickle_path)
+            )
+        )
+
+
+    def export_snapshot(self, dataset):
+        """
+        Exports the core records of a dataset (interactions, annotation
+        records, intercell class memberships, enzyme-substrate or complex
+        records) to an Arrow IPC file next to its pickle.
+        """
+
+        mod = self.dataset_module(dataset)
+
+        if mod not in snapshot.RECORDS:
+
+            self._log('No snapshot available for dataset `%s`.' % dataset)
+            return
+
+        with self._instrument(dataset, 'snapshot_export'):
+
+            snapshot.export(
+                snapshot.RECORDS[mod](self, dataset),
+                self.snapshot_path(dataset),
+            )
+
+
+    def open_snapshot(self, dataset, columns = None):
+        """
+        Returns the records of a dataset as a memory mapped
+        ``pyarrow.Table``. Only the columns accessed are read from the
+        disk, and the dataset itself is not loaded, unless the snapshot
+        has to be exported first.
+        """
+
+        self._record_access(dataset)
+
+        if not self.snapshot_valid(dataset):
+
+            self.export_snapshot(dataset)
+
+        return snapshot.read(self.snapshot_path(dataset), columns = columns)
+
+
+    def snapshot_df(self, dataset, columns = None):
+        """
+        The records of a dataset from its snapshot as a data frame.
+        """
+
+        return self.open_snapshot(dataset, columns = columns).to_pandas()
+
+
+    def _cache_prefix(self, dataset):
+        """
+        The beginning of the paths of the data frame caches, the chunks
+        and the snapshot of a dataset. For views it contains the prefix
+        of the parent and a hash of the view definition: the pickle of
+        the standalone variant of the same dataset is unrelated to them.
+        """
+
+        if self.is_view(dataset):
+
+            param = self.view_param(dataset)
+
+            return '%s__view_%s_%s' % (
+                self._cache_prefix(param['parent']),
+                dataset,
+                fingerprint.digest(
+                    {
+                        'view': param,
+                        'args': self.get_build_args(dataset),
+                    },
+                    length = 8,
+                ),
+            )
+
+        return os.path.splitext(self.pickle_path(dataset))[0]
+
+
+    def _cache_pickle_path(self, dataset):
+        """
+        The pickle the caches of a dataset are derived from: for views
+        the pickle of their root parent.
+        """
+
+        while self.is_view(dataset):
+
+            dataset = self.view_param(dataset)['parent']
+
+        return self.pickle_path(dataset)
+
+
+    def _network_df_cache_enabled(self):
+
+        if not self.get_param('network_df_cache'):
+
+            return False
+
+        if not lazy.available('pyarrow'):
+
+            self._log(
+                'Module `pyarrow` not available, '
+                'network data frames won\'t be cached.'
+            )
+
+            return False
+
+        return True
+
+
+    def _read_network_df_cache(self, dataset, variant):
+
+        if not self._network_df_cache_enabled():
+
+            return None
+
+        path = self.network_df_cache_path(dataset, variant)
+
+        if not path or not os.path.exists(path):
+
+            return None
+
+        self._log(
+            'Loading `%s` network data frame of `%s` from `%s`.' % (
+                variant,
+                dataset,
+                path,
+            )
+        )
+
+        return chunked.read_frame(path)
+
+
+    def _write_network_df_cache(self, dataset, variant, df):
+
+        if not self._network_df_cache_enabled():
+
+            return
+
+        path = self.network_df_cache_path(dataset, variant)
+
+        if not path:
+
+            return
+
+        self.remove_network_df_cache(dataset, variant)
+
+        try:
+
+            chunked.write_frame(df, path)
+
+            self._log(
+                'Saved `%s` network data frame of `%s` to `%s`.' % (
+                    variant,
+                    dataset,
+                    path,
+                )
+            )
+
+        except (pyarrow.ArrowException, ValueError, TypeError) as e:
+
+            self._log(
+                'Failed to save `%s` network data frame of `%s`: %s' % (
+                    variant,
+                    dataset,
+                    str(e),
+                )
+            )
+
+            if os.path.exists(path):
+
+                os.remove(path)
+
+
+    def remove_network_df_cache(self, dataset, variant = '*'):
+        """
+        Deletes the cached network data frame files of a dataset.
+        """
+
+        for path in glob.glob(
+            '%s__%s__*.*' % (self._cache_prefix(dataset), variant)
+        ):
+
+            os.remove(path)
+
+
+    def _network_df(self, obj, **kwargs):
+
+        if not isinstance(obj, network.Network):
+
+            obj = network.Network.from_igraph(obj)
+
+        obj.make_df(**kwargs)
+
+        return obj.df
+
+
+    def _add_network_df(self, dataset):
+        """
+        Registers a network dataset, the data frames will be created
+        when first accessed by ``network_df``.
+        """
+
+        obj = getattr(self, dataset)
+
+        if (
+            (
+                hasattr(obj, 'graph') and
+                isinstance(obj.graph, main.igraph.Graph)
+            ) or
+            isinstance(obj, network.Network)
+        ):
+
+            self.network_dfs[dataset] = {}
+
+
+    def set_network(
+            self,
+            dataset,
+            by_source = False,
+            network_object = False,
+        ):
+        """
+        Sets dataset as the default network of the intercell dataset.
+        Nothing happens if the same network is registered already,
+        e.g. by the previous task, as registering resets the network
+        related state of the intercell object. Returns the network data
+        frame, or the network object itself if ``network_object`` is
+        True. Out of core data frames are read into memory as a whole.
+        """
+
+        network = (
+            self.get_db(dataset)
+                if network_object else
+            self.network_df(dataset, by_source = by_source)
+        )
+
+        if self.client():
+
+            # the network is registered by the server for the calls
+            # of this client only
+            self.server.set_network(
+                dataset,
+                by_source = by_source,
+                network_object = network_object,
+            )
+
+            return network
+
+        intercell = self.get_db('intercell')
+
+        if getattr(intercell, 'network', None) is not network:
+
+            intercell.register_network(network)
+
+        return network
+
+
+def _process_memory(pid):
+    """
+    Memory used by a process alone in bytes (unique set size: its private
+    pages), None if not available (only Linux is supported). The pages a
+    forked child shares with its parent are not counted. Falls back to
+    the resident memory if ``smaps_rollup`` is not available (Linux
+    older than 4.14).
+    """
+
+    try:
+
+        with open('/proc/%u/smaps_rollup' % pid, 'r') as fp:
+
+            return sum(
+                int(line.split()[1]) * 1024
+                for line in fp
+                if line.startswith(('Private_Clean:', 'Private_Dirty:'))
+            )
+
+    except (OSError, ValueError, IndexError):
+
+        pass
+
+    try:
+
+        with open('/proc/%u/statm' % pid, 'r') as fp:
+
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+
+def _isolated_build_worker(conn, dataset, param):
+    """
+    Builds one dataset in a child process and sends the result or the
+    traceback of the error to the parent.
+    """
+
+    try:
+
+        conn.send(('ok', _build_dataset_worker(dataset, param)))
+
+    except Exception:
+
+        conn.send(('error', traceback.format_exc()))
+
+    finally:
+
+        conn.close()
+
+
+def _build_dataset_worker(dataset, param):
+    """
+    Builds one dataset in a worker process. The datasets it depends on
+    are loaded from their pickles, these must be ready by the time this
+    function is called.
+    """
+
+    database = Database(**param)
+
+    for dep_dataset in database.dataset_dependencies(dataset):
+
+        database.ensure_dataset(dep_dataset)
 
-        self.ensure_dataset('intercell')
+    database._build_and_save(dataset)
 
-        self.intercell.register_network(network_df)
+    return database.pickle_path(dataset), database.stats
 
 #
 # to be removed once we have it elsewhere:
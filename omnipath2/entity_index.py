@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import threading
+
+from omnipath2 import lazy
+
+np = lazy.lazy_import('numpy')
+
+
+class EntityIndex(object):
+    """
+    Maps entities (proteins, complexes, miRNAs) to dense integer codes,
+    shared by all datasets. Sets of entities are represented as sorted
+    unique integer arrays, so the set operations can be done by numpy
+    instead of comparing identifier strings. The entities are converted
+    back only when the results are exported.
+    """
+
+
+    def __init__(self):
+
+        self.codes = {}
+        self.entities = []
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+
+        return len(self.entities)
+
+
+    def __repr__(self):
+
+        return '<Entity index: %u entities>' % len(self)
+
+
+    def encode(self, entities):
+        """
+        Returns the codes of the entities as a sorted array of unique
+        integers. Entities not in the index are added.
+        """
+
+        codes = self.codes
+        entities = set(entities)
+        missing = [e for e in entities if e not in codes]
+
+        if missing:
+
+            with self._lock:
+
+                for e in missing:
+
+                    if e not in codes:
+
+                        codes[e] = len(self.entities)
+                        self.entities.append(e)
+
+        return np.unique(
+            np.fromiter(
+                (codes[e] for e in entities),
+                dtype = np.int64,
+                count = len(entities),
+            )
+        )
+
+
+    def decode(self, codes):
+        """
+        Returns the entities of an array of codes as a set.
+        """
+
+        return {self.entities[code] for code in codes}
+
+
+    @staticmethod
+    def intersection(codes0, codes1):
+
+        return np.intersect1d(codes0, codes1, assume_unique = True)
+
+
+    @staticmethod
+    def union(codes0, codes1):
+
+        return np.union1d(codes0, codes1)
+
+
+    @staticmethod
+    def difference(codes0, codes1):
+
+        return np.setdiff1d(codes0, codes1, assume_unique = True)
+
+
+    @staticmethod
+    def count_intersection(codes0, codes1):
+
+        return len(np.intersect1d(codes0, codes1, assume_unique = True))
+
+
+    @staticmethod
+    def count_union(codes0, codes1):
+
+        return len(np.union1d(codes0, codes1))
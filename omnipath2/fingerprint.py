@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import hashlib
+
+from pypath.share import common
+
+
+def stable_repr(obj, _seen = None):
+    """
+    A string representation of nested containers and simple objects
+    which does not depend on memory addresses or the iteration order
+    of sets and dicts. Raises ``TypeError`` for objects which can be
+    represented only by their memory address.
+    """
+
+    _seen = _seen or set()
+
+    if isinstance(
+        obj,
+        (common.basestring, bytes, int, float, bool, type(None)),
+    ):
+
+        return repr(obj)
+
+    if id(obj) in _seen:
+
+        return '<cycle>'
+
+    _seen = _seen | {id(obj)}
+
+    if isinstance(obj, dict):
+
+        return '{%s}' % ','.join(sorted(
+            '%s:%s' % (stable_repr(k, _seen), stable_repr(v, _seen))
+            for k, v in obj.items()
+        ))
+
+    if isinstance(obj, (set, frozenset)):
+
+        return '{%s}' % ','.join(sorted(
+            stable_repr(i, _seen) for i in obj
+        ))
+
+    if isinstance(obj, (list, tuple)):
+
+        return '[%s]' % ','.join(stable_repr(i, _seen) for i in obj)
+
+    if callable(obj) and hasattr(obj, '__qualname__'):
+
+        return '%s.%s' % (getattr(obj, '__module__', ''), obj.__qualname__)
+
+    if hasattr(obj, '__dict__'):
+
+        return '%s(%s)' % (
+            obj.__class__.__name__,
+            stable_repr(vars(obj), _seen),
+        )
+
+    result = repr(obj)
+
+    if ' at 0x' in result:
+
+        raise TypeError('No stable representation for `%s`.' % result)
+
+    return result
+
+
+def digest(obj, length = 16):
+    """
+    A short hash of the stable representation of an object.
+    """
+
+    return hashlib.md5(
+        stable_repr(obj).encode('utf-8')
+    ).hexdigest()[:length]
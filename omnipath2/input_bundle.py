@@ -0,0 +1,545 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import sys
+import json
+import hashlib
+import zipfile
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+
+from pypath.share import session as session_mod
+from pypath.share import settings as pp_settings
+
+from omnipath2 import lazy
+
+curl = lazy.lazy_import('pypath.share.curl')
+
+
+_logger = session_mod.Logger(name = 'op2.input_bundle')
+_log = _logger._log
+
+MANIFEST_NAME = 'manifest.json'
+BLOCK_SIZE = 1024 ** 2
+
+
+def default_cachedir():
+    """
+    The cache directory of pypath, where the downloaded input files are
+    stored.
+    """
+
+    return os.path.abspath(
+        pp_settings.get('cachedir') or
+        os.path.join(os.path.expanduser('~'), '.pypath', 'cache')
+    )
+
+
+class InputRecorder(session_mod.Logger):
+    """
+    Records the input files used while a dataset is built: the cache files
+    of the downloads by ``pypath.share.curl.Curl`` and, optionally, any
+    other file created or modified in the cache directory.
+    """
+
+
+    def __init__(self, cachedir = None, scan = False):
+        """
+        cachedir : str
+            The pypath cache directory, by default the one from the
+            pypath settings.
+        scan : bool
+            Record also the files created or modified in the cache
+            directory. Listing the cache directory before and after the
+            build is slow with large caches, and other processes writing
+            it at the same time, e.g. parallel builds, make this
+            unreliable.
+        """
+
+        session_mod.Logger.__init__(self, name = 'op2.input_recorder')
+
+        self.cachedir = os.path.abspath(cachedir or default_cachedir())
+        self.scan = scan
+        self.files = set()
+        self._lock = threading.Lock()
+
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Records the input files during a ``with`` block.
+        """
+
+        before = self._listing() if self.scan else {}
+        original = curl.Curl.__init__
+        recorder = self
+
+        def __init__(curl_self, *args, **kwargs):
+
+            try:
+
+                original(curl_self, *args, **kwargs)
+
+            finally:
+
+                recorder.add(getattr(curl_self, 'cache_file_name', None))
+
+        curl.Curl.__init__ = __init__
+
+        try:
+
+            yield self
+
+        finally:
+
+            curl.Curl.__init__ = original
+
+            if self.scan:
+
+                for path, mtime in self._listing().items():
+
+                    if before.get(path) != mtime:
+
+                        self.add(path)
+
+            self._log(
+                'Recorded %u input files in `%s`.' % (
+                    len(self.files),
+                    self.cachedir,
+                )
+            )
+
+
+    def add(self, path):
+        """
+        Adds a file, if it exists in the cache directory, by its path
+        relative to the cache directory.
+        """
+
+        if not path:
+
+            return
+
+        path = os.path.abspath(path)
+
+        if os.path.isfile(path) and path.startswith(self.cachedir + os.sep):
+
+            with self._lock:
+
+                self.files.add(os.path.relpath(path, self.cachedir))
+
+
+    def _listing(self):
+
+        listing = {}
+
+        for root, dirs, files in os.walk(self.cachedir):
+
+            for fname in files:
+
+                path = os.path.join(root, fname)
+
+                try:
+
+                    listing[path] = os.stat(path).st_mtime_ns
+
+                except OSError:
+
+                    pass
+
+        return listing
+
+
+def checksum(path):
+
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as fp:
+
+        for block in iter(lambda: fp.read(BLOCK_SIZE), b''):
+
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def read_manifest(path):
+
+    if path and os.path.exists(path):
+
+        with open(path, 'r') as fp:
+
+            return json.load(fp)
+
+    return {'datasets': {}, 'files': {}}
+
+
+def update_manifest(path, inputs, cachedir = None):
+    """
+    Adds the input files of datasets to a manifest, together with their
+    size and checksum. The files recorded earlier for the same datasets
+    are kept, as parsed inputs cached in memory or on the disk are not
+    read from the file again, hence not recorded in every build.
+
+    path : str
+        Path to the manifest JSON file.
+    inputs : dict
+        Dataset names and relative paths of their input files.
+    cachedir : str
+        The cache directory the paths are relative to.
+    """
+
+    cachedir = cachedir or default_cachedir()
+    manifest = read_manifest(path)
+
+    for dataset, files in inputs.items():
+
+        manifest['datasets'][dataset] = sorted(
+            set(manifest['datasets'].get(dataset, ())) | set(files)
+        )
+
+    for dataset, files in manifest['datasets'].items():
+
+        for rel_path in files:
+
+            abs_path = os.path.join(cachedir, rel_path)
+
+            if not os.path.exists(abs_path):
+
+                continue
+
+            stat = os.stat(abs_path)
+            record = manifest['files'].get(rel_path)
+
+            if (
+                not record or
+                record['size'] != stat.st_size or
+                record['mtime_ns'] != stat.st_mtime_ns
+            ):
+
+                manifest['files'][rel_path] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': checksum(abs_path),
+                }
+
+    tmp_path = '%s.tmp' % path
+
+    with open(tmp_path, 'w') as fp:
+
+        json.dump(manifest, fp, sort_keys = True, indent = 4)
+
+    os.replace(tmp_path, path)
+
+    _log('Input manifest updated: `%s`.' % path)
+
+    return manifest
+
+
+def _select(manifest, datasets = None):
+
+    datasets = datasets or sorted(manifest['datasets'].keys())
+    missing = set(datasets) - set(manifest['datasets'].keys())
+
+    if missing:
+
+        raise KeyError(
+            'Datasets not in the manifest: %s.' % ', '.join(sorted(missing))
+        )
+
+    files = sorted({
+        rel_path
+        for dataset in datasets
+        for rel_path in manifest['datasets'][dataset]
+        if rel_path in manifest['files']
+    })
+
+    return {
+        'datasets': {
+            dataset: manifest['datasets'][dataset]
+            for dataset in datasets
+        },
+        'files': {
+            rel_path: manifest['files'][rel_path]
+            for rel_path in files
+        },
+    }
+
+
+def pack(manifest_path, bundle_path, datasets = None, cachedir = None):
+    """
+    Packs the input files of datasets into a zip archive, together with
+    their manifest. The files are checked against the manifest before
+    packing.
+
+    manifest_path : str
+        Path to the manifest JSON file.
+    bundle_path : str
+        Path to the zip archive.
+    datasets : list
+        Pack the inputs of these datasets; by default all datasets in the
+        manifest.
+    """
+
+    cachedir = cachedir or default_cachedir()
+    manifest = _select(read_manifest(manifest_path), datasets)
+    failed = verify(manifest, cachedir)
+
+    if failed:
+
+        raise ValueError(
+            'Input files missing or changed since recorded: %s.' % (
+                ', '.join(failed)
+            )
+        )
+
+    tmp_path = '%s.tmp' % bundle_path
+
+    with zipfile.ZipFile(
+        tmp_path,
+        'w',
+        compression = zipfile.ZIP_DEFLATED,
+        allowZip64 = True,
+    ) as bundle:
+
+        bundle.writestr(
+            MANIFEST_NAME,
+            json.dumps(manifest, sort_keys = True, indent = 4),
+        )
+
+        for rel_path in manifest['files'].keys():
+
+            bundle.write(os.path.join(cachedir, rel_path), rel_path)
+
+    os.replace(tmp_path, bundle_path)
+
+    _log(
+        'Packed %u input files of %u datasets into `%s`.' % (
+            len(manifest['files']),
+            len(manifest['datasets']),
+            bundle_path,
+        )
+    )
+
+
+def _unpack_file(bundle_path, rel_path, record, cachedir):
+    """
+    Extracts one file, checks its size and checksum, and moves it into
+    the cache directory only if these match the manifest.
+    """
+
+    path = os.path.join(cachedir, rel_path)
+
+    if (
+        os.path.exists(path) and
+        os.path.getsize(path) == record['size'] and
+        checksum(path) == record['sha256']
+    ):
+
+        return True
+
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = '%s.tmp%u' % (path, threading.get_ident())
+    sha256 = hashlib.sha256()
+
+    # one handle for each thread, the members are read concurrently
+    with zipfile.ZipFile(bundle_path, 'r') as bundle:
+
+        with bundle.open(rel_path, 'r') as src, open(tmp_path, 'wb') as dst:
+
+            for block in iter(lambda: src.read(BLOCK_SIZE), b''):
+
+                sha256.update(block)
+                dst.write(block)
+
+    if (
+        os.path.getsize(tmp_path) != record['size'] or
+        sha256.hexdigest() != record['sha256']
+    ):
+
+        os.remove(tmp_path)
+
+        return False
+
+    os.replace(tmp_path, path)
+
+    return True
+
+
+def unpack(bundle_path, cachedir = None, threads = None):
+    """
+    Extracts the input files from a bundle into the cache directory, so
+    the datasets can be built without network access. The files are
+    extracted in parallel and each is checked against the manifest.
+
+    bundle_path : str
+        Path to a zip archive created by ``pack``.
+    cachedir : str
+        Extract into this directory, by default the pypath cache.
+    threads : int
+        Number of threads; by default the number of CPU cores.
+    """
+
+    cachedir = cachedir or default_cachedir()
+
+    with zipfile.ZipFile(bundle_path, 'r') as bundle:
+
+        manifest = json.loads(bundle.read(MANIFEST_NAME))
+
+    failed = []
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers = threads or os.cpu_count(),
+    ) as executor:
+
+        futures = {
+            executor.submit(
+                _unpack_file,
+                bundle_path,
+                rel_path,
+                record,
+                cachedir,
+            ): rel_path
+            for rel_path, record in manifest['files'].items()
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+
+            if not future.result():
+
+                failed.append(futures[future])
+
+    if failed:
+
+        raise ValueError(
+            'Checksum mismatch in bundle `%s`: %s.' % (
+                bundle_path,
+                ', '.join(sorted(failed)),
+            )
+        )
+
+    _log(
+        'Unpacked %u input files of %u datasets from `%s` to `%s`.' % (
+            len(manifest['files']),
+            len(manifest['datasets']),
+            bundle_path,
+            cachedir,
+        )
+    )
+
+    return manifest
+
+
+def verify(manifest, cachedir = None, threads = None):
+    """
+    Checks the input files in the cache directory against a manifest.
+    Returns the relative paths of the missing or changed files.
+
+    manifest : dict,str
+        A manifest or path to a manifest JSON file.
+    """
+
+    cachedir = cachedir or default_cachedir()
+    manifest = (
+        read_manifest(manifest)
+            if isinstance(manifest, str) else
+        manifest
+    )
+
+    def _check(rel_path, record):
+
+        path = os.path.join(cachedir, rel_path)
+
+        return (
+            os.path.exists(path) and
+            os.path.getsize(path) == record['size'] and
+            checksum(path) == record['sha256']
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers = threads or os.cpu_count(),
+    ) as executor:
+
+        result = executor.map(
+            lambda item: (item[0], _check(*item)),
+            manifest['files'].items(),
+        )
+
+        return sorted(rel_path for rel_path, ok in result if not ok)
+
+
+def main():
+
+    import omnipath2
+
+    parser = argparse.ArgumentParser(
+        description = 'Packs and unpacks the input files of the datasets.',
+    )
+    parser.add_argument('command', choices = ('pack', 'unpack', 'verify'))
+    parser.add_argument('bundle', nargs = '?')
+    parser.add_argument('--manifest')
+    parser.add_argument('--cachedir')
+    parser.add_argument('--datasets', nargs = '*')
+    parser.add_argument('--threads', type = int)
+    args = parser.parse_args()
+
+    manifest_path = (
+        args.manifest or
+        omnipath2.data.input_manifest_path()
+    )
+
+    if args.command == 'pack':
+
+        pack(
+            manifest_path,
+            args.bundle,
+            datasets = args.datasets,
+            cachedir = args.cachedir,
+        )
+
+    elif args.command == 'unpack':
+
+        unpack(args.bundle, cachedir = args.cachedir, threads = args.threads)
+
+    else:
+
+        failed = verify(
+            manifest_path,
+            cachedir = args.cachedir,
+            threads = args.threads,
+        )
+
+        for rel_path in failed:
+
+            sys.stdout.write('%s\n' % rel_path)
+
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+
+    main()
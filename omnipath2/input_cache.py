@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import sys
+import importlib
+import pickle
+import functools
+import collections
+import contextlib
+import threading
+
+from pypath.share import session as session_mod
+
+from omnipath2 import fingerprint
+
+
+class InputCache(session_mod.Logger):
+    """
+    Caches the results of the pypath input functions, so a resource used
+    by more than one dataset is read and parsed only once. The results
+    are stored pickled and each call gets its own copy, hence the build
+    process can modify them freely.
+
+    The cache has a memory layer, limited by ``max_size``, and optionally
+    a directory layer, limited by ``max_shared_size``, which can be shared
+    between processes, e.g. the parallel build workers. In both layers
+    the least recently used items are removed first. The cache has no
+    way to tell if the input files or the pypath version have changed,
+    the shared directory should not outlive one build session.
+    """
+
+
+    def __init__(
+            self,
+            max_size = 4096,
+            shared_dir = None,
+            max_shared_size = None,
+        ):
+        """
+        max_size : int
+            Size limit of the memory layer in MB.
+        shared_dir : str
+            Directory for the shared layer, None disables the shared layer.
+        max_shared_size : int
+            Size limit of the shared layer in MB, None means no limit.
+        """
+
+        session_mod.Logger.__init__(self, name = 'op2.input_cache')
+
+        self.max_size = max_size * 1024 ** 2
+        self.shared_dir = shared_dir
+        self.max_shared_size = (
+            max_shared_size * 1024 ** 2
+                if max_shared_size else
+            None
+        )
+        self.items = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._originals = {}
+        self._wrappers = {}
+        self._lock = threading.Lock()
+
+        if self.shared_dir:
+
+            os.makedirs(self.shared_dir, exist_ok = True)
+
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Enables the cache for the duration of a ``with`` block.
+        """
+
+        self.enable()
+
+        try:
+
+            yield self
+
+        finally:
+
+            self.disable()
+
+
+    def enable(self):
+        """
+        Replaces the functions of the ``pypath.inputs`` modules by
+        caching wrappers, also where other input modules refer to them.
+        The modules not imported yet are imported later by
+        ``pypath.inputs.get_method``, the functions it returns are
+        wrapped too.
+        """
+
+        if self._originals:
+
+            return
+
+        modules = [
+            mod
+            for name, mod in list(sys.modules.items())
+            if name.startswith('pypath.inputs.') and mod is not None
+        ]
+
+        for mod in modules:
+
+            for attr, value in list(vars(mod).items()):
+
+                if (
+                    callable(value) and
+                    not attr.startswith('_') and
+                    not isinstance(value, type) and
+                    getattr(value, '__module__', '') == mod.__name__
+                ):
+
+                    self._originals[id(value)] = value
+
+        self._wrappers = {
+            _id: self._wrap(func)
+            for _id, func in self._originals.items()
+        }
+        wrappers = self._wrappers
+        self._patched = []
+
+        for mod in modules:
+
+            for attr, value in list(vars(mod).items()):
+
+                if (
+                    id(value) in self._originals and
+                    value is self._originals[id(value)]
+                ):
+
+                    setattr(mod, attr, wrappers[id(value)])
+                    self._patched.append((mod, attr, value))
+
+        try:
+
+            inputs_mod = importlib.import_module('pypath.inputs')
+
+        except ImportError:
+
+            inputs_mod = None
+
+        if hasattr(inputs_mod, 'get_method'):
+
+            get_method = inputs_mod.get_method
+            inputs_mod.get_method = self._wrap_get_method(get_method)
+            self._patched.append((inputs_mod, 'get_method', get_method))
+
+        self._log(
+            'Input cache enabled for %u functions.' % len(self._originals)
+        )
+
+
+    def disable(self):
+        """
+        Restores the original input functions.
+        """
+
+        for mod, attr, value in getattr(self, '_patched', ()):
+
+            setattr(mod, attr, value)
+
+        self._patched = []
+        self._originals = {}
+        self._wrappers = {}
+
+        self._log(
+            'Input cache disabled. Hits: %u, misses: %u, '
+            'size: %.01f MB.' % (self.hits, self.misses, self.size / 1024 ** 2)
+        )
+
+
+    def _wrap_get_method(self, get_method):
+
+        @functools.wraps(get_method)
+        def wrapper(*args, **kwargs):
+
+            func = get_method(*args, **kwargs)
+
+            if (
+                not callable(func) or
+                getattr(func, 'input_cache', None) is self or
+                not getattr(func, '__module__', '').startswith(
+                    'pypath.inputs.'
+                )
+            ):
+
+                return func
+
+            with self._lock:
+
+                if id(func) not in self._wrappers:
+
+                    self._originals[id(func)] = func
+                    self._wrappers[id(func)] = self._wrap(func)
+
+                return self._wrappers[id(func)]
+
+        return wrapper
+
+
+    def _wrap(self, func):
+
+        name = '%s.%s' % (func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            try:
+
+                key = fingerprint.digest((name, args, kwargs), length = 32)
+
+            except TypeError:
+
+                # arguments without a stable key can't be cached
+                return func(*args, **kwargs)
+
+            data = self.get(key)
+
+            if data is not None:
+
+                self.hits += 1
+
+                return pickle.loads(data)
+
+            self.misses += 1
+            result = func(*args, **kwargs)
+
+            try:
+
+                data = pickle.dumps(result, protocol = pickle.HIGHEST_PROTOCOL)
+
+            except (pickle.PicklingError, TypeError, AttributeError):
+
+                # e.g. generators or open files, these we don't cache
+                return result
+
+            self.set(key, data)
+
+            return pickle.loads(data)
+
+        wrapper.input_cache = self
+
+        return wrapper
+
+
+    def get(self, key):
+
+        with self._lock:
+
+            if key in self.items:
+
+                self.items.move_to_end(key)
+
+                return self.items[key]
+
+        path = self._shared_path(key)
+
+        if path and os.path.exists(path):
+
+            with open(path, 'rb') as fp:
+
+                data = fp.read()
+
+            # updates the access time for the eviction
+            os.utime(path)
+            self._set_memory(key, data)
+
+            return data
+
+
+    def set(self, key, data):
+
+        self._set_memory(key, data)
+        path = self._shared_path(key)
+
+        if path and not os.path.exists(path):
+
+            tmp_path = '%s.%u.tmp' % (path, os.getpid())
+
+            with open(tmp_path, 'wb') as fp:
+
+                fp.write(data)
+
+            os.replace(tmp_path, path)
+            self._evict_shared()
+
+
+    def _set_memory(self, key, data):
+
+        if len(data) > self.max_size:
+
+            return
+
+        with self._lock:
+
+            if key in self.items:
+
+                self.size -= len(self.items.pop(key))
+
+            self.items[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_size:
+
+                _, evicted = self.items.popitem(last = False)
+                self.size -= len(evicted)
+
+
+    def _shared_path(self, key):
+
+        if self.shared_dir:
+
+            return os.path.join(self.shared_dir, '%s.pickle' % key)
+
+
+    def _evict_shared(self):
+
+        if not self.max_shared_size:
+
+            return
+
+        files = []
+
+        for fname in os.listdir(self.shared_dir):
+
+            if fname.endswith('.pickle'):
+
+                path = os.path.join(self.shared_dir, fname)
+
+                try:
+
+                    stat = os.stat(path)
+
+                except FileNotFoundError:
+
+                    # removed by another process
+                    continue
+
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+
+        for _, size, path in sorted(files):
+
+            if total <= self.max_shared_size:
+
+                break
+
+            with contextlib.suppress(FileNotFoundError):
+
+                os.remove(path)
+
+            total -= size
+
+
+    def clear(self):
+        """
+        Empties the memory layer. The shared layer is kept.
+        """
+
+        with self._lock:
+
+            self.items = collections.OrderedDict()
+            self.size = 0
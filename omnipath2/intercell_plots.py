@@ -25,10 +25,8 @@
 import itertools
 
 import numpy as np
-import scipy.cluster.hierarchy
 import matplotlib as mpl
 import matplotlib.cm
-import pattern.en
 
 from pypath.share import session as session_mod
 from pypath.share import common
@@ -45,6 +43,11 @@ import omnipath2
 from omnipath2 import plot
 from omnipath2 import settings
 from omnipath2 import table
+from omnipath2 import lazy
+
+# slow to import and used only by a few plots
+pattern_en = lazy.lazy_import('pattern.en')
+scipy_hierarchy = lazy.lazy_import('scipy.cluster.hierarchy')
 
 
 class InterClassDegreeHisto(plot.PlotBase):
@@ -110,13 +113,7 @@ class InterClassDegreeHisto(plot.PlotBase):
 
         self.data = omnipath2.data
         self.intercell = self.data.get_db('intercell')
-        self.data.ensure_dataset(self.network_dataset)
-        self.intercell.register_network(
-            self.data.network_df(
-                self.network_dataset,
-                by_source = True,
-            )
-        )
+        self.data.set_network(self.network_dataset, by_source = True)
         self.degrees = self.intercell.degree_inter_class_network(
             annot_args_source = {
                 'name': self.class0,
@@ -165,7 +162,7 @@ class CountsScatterBase(plot.PlotBase):
         param = {
             'maketitle': True,
             'xlab': 'Number of %s' % (
-                pattern.en.pluralize(entity_type)
+                pattern_en.pluralize(entity_type)
                     if isinstance(entity_type, common.basestring) else
                 'entities'
             ),
@@ -378,11 +375,11 @@ class ClassSimilarities(plot.PlotBase):
             len(main_classes),
             len(main_classes),
         )
-        self.xlinked = scipy.cluster.hierarchy.linkage(
+        self.xlinked = scipy_hierarchy.linkage(
             self.sims.T,
             **self.link_param
         )
-        self.ylinked = scipy.cluster.hierarchy.linkage(
+        self.ylinked = scipy_hierarchy.linkage(
             self.sims,
             **self.link_param
         )
@@ -474,7 +471,7 @@ class ClassSimilarities(plot.PlotBase):
             setattr(
                 self,
                 '%s_dendro' % orientation,
-                scipy.cluster.hierarchy.dendrogram(
+                scipy_hierarchy.dendrogram(
                     self.xlinked if orientation == 'top' else self.ylinked,
                     ax = self.ax,
                     orientation = orientation,
@@ -550,8 +547,7 @@ class InterClassChordplotData(table.TableBase):
     def load(self):
 
         self.intercell = omnipath2.data.get_db('intercell')
-        network = omnipath2.data.network_df(self.network_dataset)
-        self.intercell.register_network(network)
+        omnipath2.data.set_network(self.network_dataset)
         self.edges = self.intercell.class_to_class_connections(
             **self.intercell_network_param,
         )
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import types
+import importlib
+import importlib.util
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands for a module which is imported only at the first access to
+    any of its attributes. For modules which are slow to import and not
+    needed in every run.
+    """
+
+
+    def __init__(self, name):
+
+        types.ModuleType.__init__(self, name)
+        self.__dict__['_module'] = None
+
+
+    def _load(self):
+
+        if self.__dict__['_module'] is None:
+
+            self.__dict__['_module'] = importlib.import_module(self.__name__)
+
+        return self.__dict__['_module']
+
+
+    def __getattr__(self, attr):
+
+        return getattr(self._load(), attr)
+
+
+    def __dir__(self):
+
+        return dir(self._load())
+
+
+    def __repr__(self):
+
+        return (
+            '<Lazy module `%s`, not imported yet>' % self.__name__
+                if self.__dict__['_module'] is None else
+            repr(self.__dict__['_module'])
+        )
+
+
+def lazy_import(name):
+
+    return LazyModule(name)
+
+
+def available(name):
+    """
+    Tells if a module can be imported, without importing it.
+    """
+
+    try:
+
+        return importlib.util.find_spec(name) is not None
+
+    except (ImportError, ValueError):
+
+        return False
@@ -23,27 +23,42 @@
 #
 
 
+import sys
 import importlib as imp
 import collections
 import itertools
+import traceback
+import contextlib
+import multiprocessing
+import concurrent.futures
 
 from pypath.share import common
 from pypath.share import session as session_mod
 
 import omnipath2
 from omnipath2 import settings as op2_settings
-from omnipath2 import r_preprocess
-from omnipath2 import annotation_plots
-from omnipath2 import intercell_plots
-from omnipath2 import network_plots
-from omnipath2 import complexes_plots
-from omnipath2 import supptables
-from omnipath2 import r_runner
+from omnipath2 import task_state as task_state_mod
+from omnipath2 import profiling
+
+# the modules of the tasks are imported only when a task runs;
+# they import plotting and scientific libraries which are slow to load
+TASK_MODULES = (
+    'r_preprocess',
+    'network_plots',
+    'annotation_plots',
+    'complexes_plots',
+    'intercell_plots',
+    'supptables',
+    'r_runner',
+)
 
 
 _logger = session_mod.Logger(name = 'op2.main')
 _log = _logger._log
 
+# the task state of the parallel runs, inherited by the forked workers
+_job_state = None
+
 
 class ProductParam(object):
 
@@ -101,6 +116,12 @@ class Task(
 
 
     def __new__(cls, method, param = None, name = 'unknown'):
+        """
+        method : callable,str
+            The callable which carries out the task, or its name within
+            the ``omnipath2`` package (e.g. ``supptables.EnzSubS3``); in
+            the latter case the module is imported when the task runs.
+        """
 
         param = param or Param()
 
@@ -111,72 +132,216 @@ class Task(
         return super(Task, cls).__new__(cls, method, param, name)
 
 
-    def run(self):
+    def get_method(self):
 
-        _log('Running task `%s`.' % self.name)
+        if callable(self.method):
+
+            return self.method
+
+        mod_name, attr = self.method.rsplit('.', 1)
+        mod = imp.import_module('omnipath2.%s' % mod_name)
+
+        return getattr(mod, attr)
+
+
+    def iter_param(self):
+        """
+        Iterates over the parameter combinations of the task.
+        """
 
         for param in itertools.product(*self.param):
 
-            param = dict(itertools.chain(*(par.items() for par in param)))
+            yield dict(itertools.chain(*(par.items() for par in param)))
 
-            _log(
-                'Running with param `%s`.' % (
-                    ', '.join(
-                        '%s=%s' % (name, str(value))
-                        for name, value in param.items()
-                    )
-                )
-            )
 
-            self.method(**param)
+    def run(self, state = None):
+
+        _log('Running task `%s`.' % self.name)
+
+        for param in self.iter_param():
+
+            record = self.run_param(param, state = state)
+
+            if state:
+
+                state.update(record)
 
         _log('Task `%s` finished.' % self.name)
 
 
+    def run_param(self, param, state = None):
+        """
+        Runs the task with one combination of parameters.
+
+        param : dict
+            The parameters.
+        state : omnipath2.task_state.TaskState
+            If provided, the run is skipped if it's up to date, and the
+            outputs of the previous run are linked under the current
+            timestamp.
+
+        Returns the record of the run: for the state if provided,
+        otherwise only the outputs and the timestamp.
+        """
+
+        param_label = param_str(param)
+        _log('Running with param `%s`.' % param_label)
+
+        if state:
+
+            record = state.up_to_date(self, param)
+
+            if record:
+
+                _log('Up to date, skipping.')
+
+                return task_state_mod.link_forward(record)
+
+        with omnipath2.data.record_access() as datasets:
+
+            with _record_outputs() as outputs:
+
+                with profiling.profile(self, param, param_label):
+
+                    self.get_method()(**param)
+
+        if state:
+
+            return state.record(self, param, datasets, outputs)
+
+        return {'outputs': outputs, 'timestamp': omnipath2.data.timestamp}
+
+
+@contextlib.contextmanager
+def _record_outputs():
+    """
+    Collects the paths of the output files written within a ``with``
+    block.
+    """
+
+    files = omnipath2.files
+    update_record = files.update_record
+    outputs = []
+
+    def _update_record(path):
+
+        outputs.append(path)
+        update_record(path)
+
+    files.update_record = _update_record
+
+    try:
+
+        yield outputs
+
+    finally:
+
+        files.update_record = update_record
+
+
+def param_str(param):
+
+    return ', '.join(
+        '%s=%s' % (name, str(value))
+        for name, value in param.items()
+    )
+
+
+def _run_job(task, param):
+    """
+    Runs one parameter combination of a task in a worker process. The log
+    messages and the records of the output files are collected and sent
+    back to the parent, which writes them in the order of the tasks.
+    """
+
+    log = session_mod.get_log()
+    messages = []
+    outputs = []
+    log.msg = lambda *args, **kwargs: messages.append((args, kwargs))
+    # the files database is written by the parent process only
+    omnipath2.files.update_record = outputs.append
+    error = None
+    record = None
+    # the records inherited from the parent are not ours to send
+    profiling.pop_records()
+
+    try:
+
+        record = task.run_param(param, state = _job_state)
+
+    except Exception:
+
+        error = traceback.format_exc()
+
+    return messages, outputs, error, record, profiling.pop_records()
+
+
+class Job(
+    collections.namedtuple(
+        'JobBase',
+        [
+            'part',
+            'index',
+            'task',
+            'param',
+        ],
+    )
+):
+    """
+    One parameter combination of a task: the name of the workflow part,
+    the index of the task in the workflow, the task and the parameters.
+    """
+
+
+    def dataset(self):
+
+        return self.param.get('network_dataset')
+
+
 workflow = collections.OrderedDict(
 
     supptables = (
         Task(
-            method = supptables.NetworkS2_PPIall,
+            method = 'supptables.NetworkS2_PPIall',
             name = 'Supp Table S2, network all PPI',
         ),
         Task(
-            method = supptables.NetworkS2_PPIcurated,
+            method = 'supptables.NetworkS2_PPIcurated',
             name = 'Supp Table S2, network curated PPI',
         ),
         Task(
-            method = supptables.NetworkS2_TFtarget,
+            method = 'supptables.NetworkS2_TFtarget',
             name = 'Supp Table S2, TF-target network',
         ),
         Task(
-            method = supptables.NetworkS2_miRNAmRNA,
+            method = 'supptables.NetworkS2_miRNAmRNA',
             name = 'Supp Table S2, miRNA-mRNA network',
         ),
         Task(
-            method = supptables.NetworkS2_TFmiRNA,
+            method = 'supptables.NetworkS2_TFmiRNA',
             name = 'Supp Table S2, TF-miRNA network',
         ),
         Task(
-            method = supptables.EnzSubS3,
+            method = 'supptables.EnzSubS3',
             name = 'Supp Table S3, enzyme-substrate',
         ),
         Task(
-            method = supptables.ComplexesS4,
+            method = 'supptables.ComplexesS4',
             name = 'Supp Table S4, complexes',
         ),
         Task(
-            method = supptables.AnnotationsS5,
+            method = 'supptables.AnnotationsS5',
             name = 'Supp Table S5, annotations',
         ),
         Task(
-            method = supptables.IntercellS6,
+            method = 'supptables.IntercellS6',
             name = 'Supp Table S6, intercell',
         ),
     ),
 
     r_preprocess = (
         Task(
-            method = r_preprocess.InterClassConnections,
+            method = 'r_preprocess.InterClassConnections',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -193,11 +358,11 @@ workflow = collections.OrderedDict(
             name = 'Interclass connections table',
         ),
         Task(
-            method = r_preprocess.IntercellClasses,
+            method = 'r_preprocess.IntercellClasses',
             name = 'Intercell classes table',
         ),
         Task(
-            method = r_preprocess.IntercellCoverages,
+            method = 'r_preprocess.IntercellCoverages',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -208,7 +373,7 @@ workflow = collections.OrderedDict(
             name = 'Intercell network coverage table',
         ),
         Task(
-            method = r_preprocess.IntercellNetworkCounts,
+            method = 'r_preprocess.IntercellNetworkCounts',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -218,23 +383,23 @@ workflow = collections.OrderedDict(
             name = 'Intercell network counts table',
         ),
         Task(
-            method = r_preprocess.IntercellAnnotationsByEntity,
+            method = 'r_preprocess.IntercellAnnotationsByEntity',
             name = 'Intercell annotations by entity table',
         ),
         Task(
-            method = r_preprocess.ComplexesByResource,
+            method = 'r_preprocess.ComplexesByResource',
             name = 'Complexes by resource table',
         ),
         Task(
-            method = r_preprocess.InterClassOverlaps,
+            method = 'r_preprocess.InterClassOverlaps',
             name = 'Intercell class overlaps table',
         ),
         Task(
-            method = r_preprocess.IntercellNetworkByResource,
+            method = 'r_preprocess.IntercellNetworkByResource',
             name = 'Intercell network by resource',
         ),
         Task(
-            method = r_preprocess.ResourcesByEntity,
+            method = 'r_preprocess.ResourcesByEntity',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -245,15 +410,15 @@ workflow = collections.OrderedDict(
             name = 'Resources by entity table',
         ),
         Task(
-            method = r_preprocess.AnnotationsByEntity,
+            method = 'r_preprocess.AnnotationsByEntity',
             name = 'Annotations by entity table',
         ),
         Task(
-            method = r_preprocess.EnzymeSubstrate,
+            method = 'r_preprocess.EnzymeSubstrate',
             name = 'Enzyme-substrate interactions table',
         ),
         Task(
-            method = r_preprocess.NetworkCoverage,
+            method = 'r_preprocess.NetworkCoverage',
             name = 'Network coverage on groups of proteins',
             param = ProductParam(
                 network_dataset = (
@@ -267,22 +432,22 @@ workflow = collections.OrderedDict(
 
     complexes_plots = (
         Task(
-            method = complexes_plots.ComplexesByResource,
+            method = 'complexes_plots.ComplexesByResource',
             name = 'Complexes by resource figure',
         ),
     ),
 
     annotation_plots = (
         Task(
-            method = annotation_plots.EntitiesByResource,
+            method = 'annotation_plots.EntitiesByResource',
             name = 'Entities by annotation resource plot',
         ),
         Task(
-            method = annotation_plots.RecordsByResource,
+            method = 'annotation_plots.RecordsByResource',
             name = 'Records by annotation resource plot',
         ),
         Task(
-            method = annotation_plots.AnnotationNetworkOverlap,
+            method = 'annotation_plots.AnnotationNetworkOverlap',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -296,7 +461,7 @@ workflow = collections.OrderedDict(
 
     network_plots = (
         Task(
-            method = network_plots.EdgeNodeCounts,
+            method = 'network_plots.EdgeNodeCounts',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -314,7 +479,7 @@ workflow = collections.OrderedDict(
 
     intercell_plots = (
         Task(
-            method = intercell_plots.InterClassDegreeHisto,
+            method = 'intercell_plots.InterClassDegreeHisto',
             param = (
                 Param(
                     class0 = 'ligand',
@@ -330,7 +495,7 @@ workflow = collections.OrderedDict(
             name = 'Ligand-receptor degrees histogram',
         ),
         Task(
-            method = intercell_plots.CountsByClass,
+            method = 'intercell_plots.CountsByClass',
             param = ProductParam(
                 entity_type = (
                     'protein',
@@ -340,7 +505,7 @@ workflow = collections.OrderedDict(
             name = 'Counts by intercell class plot',
         ),
         Task(
-            method = intercell_plots.CountsByResource,
+            method = 'intercell_plots.CountsByResource',
             param = ProductParam(
                 entity_type = (
                     'protein',
@@ -350,11 +515,11 @@ workflow = collections.OrderedDict(
             name = 'Counts by intercell resource plot',
         ),
         Task(
-            method = intercell_plots.ClassSimilarities,
+            method = 'intercell_plots.ClassSimilarities',
             name = 'Intercell class similarities plot',
         ),
         Task(
-            method = intercell_plots.InterClassChordplot,
+            method = 'intercell_plots.InterClassChordplot',
             param = ProductParam(
                 network_dataset = (
                     'omnipath',
@@ -372,7 +537,7 @@ workflow = collections.OrderedDict(
 
     r_plotting = (
         Task(
-            method = r_runner.RRunner,
+            method = 'r_runner.RRunner',
             name = 'R plotting',
         ),
     ),
@@ -387,11 +552,37 @@ class Main(session_mod.Logger):
             self,
             parts = None,
             steps = None,
+            processes = None,
+            resume = None,
         ):
+        """
+        parts : list
+            Run only these parts of the workflow.
+        steps : dict
+            A workflow to run instead of the default one.
+        processes : int
+            Number of processes to run the tasks; by default the
+            ``task_processes`` setting.
+        resume : bool
+            Continue the previous run if it has been interrupted; by
+            default the ``resume`` setting.
+        """
 
         session_mod.Logger.__init__(self, name = 'op2.main')
 
         self.parts = common.to_set(parts)
+        self.processes = processes or op2_settings.get('task_processes') or 1
+        self.state = (
+            task_state_mod.TaskState()
+                if op2_settings.get('task_skip_up_to_date') else
+            None
+        )
+        self.resume = (
+            op2_settings.get('resume')
+                if resume is None else
+            resume
+        )
+        self.run_state = task_state_mod.RunState()
         self.steps = (
             steps
                 if isinstance(steps, (dict, type(None))) else
@@ -412,19 +603,16 @@ class Main(session_mod.Logger):
         omnipath2.data.reload()
         omnipath2.colors.reload()
 
-        modules = (
-            op2_settings,
-            r_preprocess,
-            network_plots,
-            annotation_plots,
-            complexes_plots,
-            intercell_plots,
-            supptables,
-        )
+        imp.reload(op2_settings)
+
+        for mod_name in TASK_MODULES:
 
-        for mod in modules:
+            mod_name = 'omnipath2.%s' % mod_name
 
-            imp.reload(mod)
+            # modules not imported yet will be imported when needed
+            if mod_name in sys.modules:
+
+                imp.reload(sys.modules[mod_name])
 
         for dataset in omnipath2.data.datasets:
 
@@ -452,6 +640,297 @@ class Main(session_mod.Logger):
                 'the workflow: %s.' % ', '.join(missing_parts)
             )
 
+        jobs = self.schedule(list(self.iter_tasks()))
+        self.run_state.start(resume = self.resume)
+
+        if self.processes > 1 and self.fork_available():
+
+            self.run_parallel(jobs)
+
+        else:
+
+            self.run_serial(jobs)
+
+        self.run_state.finish()
+        omnipath2.data.write_stats()
+        profiling.write_summary()
+
+        self._log('Workflow finished.')
+
+
+    def run_serial(self, jobs):
+        """
+        Runs the parameter combinations of the tasks one by one in
+        this process.
+        """
+
+        for j, job in enumerate(jobs):
+
+            if j == 0 or jobs[j - 1].part != job.part:
+
+                self._log('Beginning workflow part `%s`.' % job.part)
+
+            if j == 0 or jobs[j - 1].index != job.index:
+
+                self._log('Running task `%s`.' % job.task.name)
+
+            if not self.resumed(job):
+
+                self.prefetch(jobs[j + 1:])
+
+                # the prefetched datasets must not evict the ones
+                # of the running job
+                with omnipath2.data.protect(job.dataset()):
+
+                    self.job_done(
+                        job,
+                        job.task.run_param(job.param, state = self.state),
+                    )
+
+            if j == len(jobs) - 1 or jobs[j + 1].index != job.index:
+
+                self._log('Task `%s` finished.' % job.task.name)
+
+
+    def resumed(self, job):
+        """
+        Tells if a job has been completed in the interrupted run which
+        is being resumed. Its outputs are linked under the current
+        timestamp.
+        """
+
+        record = self.run_state.completed(job)
+
+        if record:
+
+            self._log(
+                'Completed in the interrupted run, skipping: `%s` with '
+                'param `%s`.' % (job.task.name, param_str(job.param))
+            )
+            self.run_state.checkpoint(
+                job,
+                task_state_mod.link_forward(record),
+            )
+
+            return True
+
+        return False
+
+
+    def job_done(self, job, record):
+
+        if self.state:
+
+            self.state.update(record)
+
+        self.run_state.checkpoint(job, record)
+
+
+    def schedule(self, tasks):
+        """
+        Creates the list of jobs (parameter combinations of tasks) from
+        the tasks. By default the jobs follow the order of the workflow.
+        If the ``task_schedule`` setting is ``affinity``, within each
+        part of the workflow the jobs are grouped by their
+        ``network_dataset``, so each network is loaded and registered
+        once in a part. The parts still follow each other in their
+        declared order, and within a group the jobs keep their order.
+        The jobs without network come first, then the group of the
+        network used last in the previous part, then the others in the
+        order of their first appearance.
+        """
+
+        jobs = [
+            Job(part_name, i, task, param)
+            for i, (part_name, task) in enumerate(tasks)
+            for param in task.iter_param()
+        ]
+
+        if op2_settings.get('task_schedule') != 'affinity':
+
+            return jobs
+
+        scheduled = []
+        current = None
+
+        for part_name, part_jobs in itertools.groupby(
+            jobs,
+            key = lambda job: job.part,
+        ):
+
+            groups = collections.OrderedDict()
+
+            for job in part_jobs:
+
+                groups.setdefault(job.dataset(), []).append(job)
+
+            # groups are removed once scheduled, repeated items are skipped
+            for dataset in [None, current] + list(groups.keys()):
+
+                if dataset in groups:
+
+                    scheduled.extend(groups.pop(dataset))
+                    current = dataset or current
+
+        self._log(
+            'Scheduled %u jobs by dataset affinity, network changes: '
+            '%u (%u in the declared order).' % (
+                len(scheduled),
+                self._network_changes(scheduled),
+                self._network_changes(jobs),
+            )
+        )
+
+        return scheduled
+
+
+    @staticmethod
+    def _network_changes(jobs):
+
+        datasets = [job.dataset() for job in jobs if job.dataset()]
+
+        return sum(a != b for a, b in zip(datasets[:-1], datasets[1:]))
+
+
+    def fork_available(self):
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+
+            return True
+
+        self._log(
+            'Running tasks in parallel requires the `fork` start method, '
+            'which is not available on this platform; running them '
+            'one by one.'
+        )
+
+        return False
+
+
+    def run_parallel(self, jobs):
+        """
+        Runs the tasks and their parameter combinations in a pool of
+        processes. The tasks within one part of the workflow are
+        independent, while the parts run one after the other, as later
+        parts might use the outputs of the earlier ones. The workers are
+        forked after loading the datasets required by the part, hence
+        they share these datasets with the parent process.
+        """
+
+        for part_name, part_jobs in itertools.groupby(
+            jobs,
+            key = lambda job: job.part,
+        ):
+
+            part_jobs = [job for job in part_jobs if not self.resumed(job)]
+
+            self._log(
+                'Beginning workflow part `%s`, running tasks in '
+                '%u processes.' % (part_name, self.processes)
+            )
+
+            self.preload(part_jobs)
+            self.run_jobs(part_jobs)
+
+
+    def preload(self, jobs):
+        """
+        Loads the datasets and network data frames required by jobs,
+        together with the datasets in the ``task_preload`` setting.
+        """
+
+        if not jobs:
+
+            return
+
+        network_datasets = {job.dataset() for job in jobs} - {None}
+        datasets = network_datasets | set(
+            op2_settings.get('task_preload') or ()
+        )
+
+        for dataset in sorted(datasets):
+
+            omnipath2.data.get_db(dataset)
+
+        for dataset in sorted(network_datasets):
+
+            omnipath2.data.network_df(dataset)
+
+        if self.state:
+
+            # the workers inherit the fingerprints
+            self.state.dataset_fingerprints(jobs)
+
+
+    def run_jobs(self, jobs):
+        """
+        Runs jobs in forked processes, and writes the log messages of
+        each in the order of the jobs.
+        """
+
+        log_msg = session_mod.get_log().msg
+        globals()['_job_state'] = self.state
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers = self.processes,
+            mp_context = multiprocessing.get_context('fork'),
+        ) as executor:
+
+            futures = [
+                executor.submit(_run_job, job.task, job.param)
+                for job in jobs
+            ]
+
+            for j, (job, future) in enumerate(zip(jobs, futures)):
+
+                if j == 0 or jobs[j - 1].index != job.index:
+
+                    self._log('Running task `%s`.' % job.task.name)
+
+                (
+                    messages,
+                    outputs,
+                    error,
+                    record,
+                    profile,
+                ) = future.result()
+                profiling.records.extend(profile)
+
+                for args, kwargs in messages:
+
+                    log_msg(*args, **kwargs)
+
+                for path in outputs:
+
+                    omnipath2.files.update_record(path)
+
+                if error:
+
+                    for _future in futures:
+
+                        _future.cancel()
+
+                    raise RuntimeError(
+                        'Task `%s` failed with param `%s`:\n%s' % (
+                            job.task.name,
+                            param_str(job.param),
+                            error,
+                        )
+                    )
+
+                self.job_done(job, record)
+
+                if j == len(jobs) - 1 or jobs[j + 1].index != job.index:
+
+                    self._log('Task `%s` finished.' % job.task.name)
+
+
+    def iter_tasks(self):
+        """
+        Iterates over the tasks of the selected workflow parts, yields
+        tuples of part names and tasks.
+        """
+
         _workflow = self.steps or workflow
 
         for part_name, part_tasks in _workflow.items():
@@ -460,10 +939,27 @@ class Main(session_mod.Logger):
 
                 continue
 
-            self._log('Beginning workflow part `%s`.' % part_name)
-
             for task in part_tasks:
 
-                task.run()
+                yield part_name, task
 
-        self._log('Workflow finished.')
+
+    def prefetch(self, upcoming):
+        """
+        Starts loading in the background the datasets of the next few
+        jobs, while the current job is running.
+        """
+
+        lookahead = op2_settings.get('prefetch_tasks')
+
+        if not lookahead:
+
+            return
+
+        datasets = sorted({
+            job.dataset()
+            for job in upcoming[:lookahead]
+            if job.dataset()
+        })
+
+        omnipath2.data.prefetch(datasets)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import sys
+import time
+import cProfile
+import itertools
+import threading
+import contextlib
+
+try:
+
+    import resource
+
+except ImportError:
+
+    # not available on Windows
+    resource = None
+
+from pypath.share import session as session_mod
+
+import omnipath2
+from omnipath2 import settings as op2_settings
+from omnipath2 import fingerprint
+from omnipath2 import lazy
+
+pyinstrument = lazy.lazy_import('pyinstrument')
+
+
+_logger = session_mod.Logger(name = 'op2.profiling')
+_log = _logger._log
+
+# the records of the task runs in this process
+records = []
+
+# the highest peak resident memory of each ongoing measurement, from
+# before the last reset of the peak (see ``peak_start``)
+_peaks = {}
+_peaks_lock = threading.Lock()
+_peak_tokens = itertools.count()
+
+HEADER = (
+    'task',
+    'param',
+    'wall_s',
+    'cpu_s',
+    'maxrss_mb',
+    'maxrss_delta_mb',
+    'ok',
+    'dump',
+)
+
+
+def _proc_status(field):
+    """
+    A memory field of ``/proc/self/status`` in bytes, None if not
+    available (only Linux is supported).
+    """
+
+    try:
+
+        with open('/proc/self/status', 'r') as fp:
+
+            for line in fp:
+
+                if line.startswith('%s:' % field):
+
+                    return int(line.split()[1]) * 1024
+
+    except (OSError, ValueError, IndexError):
+
+        pass
+
+
+def maxrss():
+    """
+    Peak resident memory of the process in bytes since the last reset
+    of the peak (see ``peak_start``), None if not available. Without
+    ``/proc`` it is the peak over the lifetime of the process.
+    """
+
+    peak = _proc_status('VmHWM')
+
+    if peak is not None or resource is None:
+
+        return peak
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _reset_peak():
+    """
+    Resets the peak resident memory of the process to its current
+    resident memory. Returns False if not possible (Linux 4.0 or newer
+    is required).
+    """
+
+    try:
+
+        with open('/proc/self/clear_refs', 'w') as fp:
+
+            fp.write('5')
+
+        return True
+
+    except OSError:
+
+        return False
+
+
+def peak_start():
+    """
+    Starts measuring the peak resident memory. Resets the peak of the
+    process, so the peak of each measurement is independent of the
+    earlier ones; the peaks of the measurements going on at the same
+    time (nested or in other threads) are preserved. Returns a token for
+    ``peak_stop`` and the baseline: the current resident memory, or the
+    lifetime peak if the peak can't be reset.
+    """
+
+    with _peaks_lock:
+
+        token = next(_peak_tokens)
+        peak = maxrss()
+
+        for other in _peaks:
+
+            _peaks[other] = max(_peaks[other], peak or 0)
+
+        _peaks[token] = 0
+
+        return token, (
+            _proc_status('VmRSS')
+                if _reset_peak() else
+            peak
+        )
+
+
+def peak_stop(token):
+    """
+    The peak resident memory in bytes since ``peak_start`` returned the
+    token, None if not available.
+    """
+
+    with _peaks_lock:
+
+        before_reset = _peaks.pop(token)
+        peak = maxrss()
+
+        return None if peak is None else max(peak, before_reset)
+
+
+def profiles_dir():
+
+    path = os.path.join(
+        op2_settings.get('profiles_dir'),
+        omnipath2.data.timestamp,
+    )
+    os.makedirs(path, exist_ok = True)
+
+    return path
+
+
+@contextlib.contextmanager
+def profile(task, param, param_label = ''):
+    """
+    Records the wall time, the CPU time and the peak resident memory of
+    running a task with one combination of parameters, if the
+    ``task_profile`` setting is True. Depending on the ``task_profiler``
+    setting, a ``cProfile`` dump or a ``pyinstrument`` report is saved
+    in the ``profiles_dir``.
+
+    task : omnipath2.main.Task
+        The task.
+    param : dict
+        The parameters.
+    param_label : str
+        Human readable form of the parameters for the summary.
+    """
+
+    if not op2_settings.get('task_profile'):
+
+        yield
+        return
+
+    profiler = op2_settings.get('task_profiler')
+    dump_path = None
+
+    if profiler == 'pyinstrument' and not lazy.available('pyinstrument'):
+
+        _log('Module `pyinstrument` not available, using `cProfile`.')
+        profiler = 'cprofile'
+
+    if profiler:
+
+        dump_path = os.path.join(
+            profiles_dir(),
+            '%s__%s.%s' % (
+                task.method
+                    if isinstance(task.method, str) else
+                task.method.__name__,
+                fingerprint.digest(param, length = 8),
+                'html' if profiler == 'pyinstrument' else 'prof',
+            ),
+        )
+        prof = (
+            pyinstrument.Profiler()
+                if profiler == 'pyinstrument' else
+            cProfile.Profile()
+        )
+
+    wall0 = time.time()
+    cpu0 = time.process_time()
+    peak_token, rss0 = peak_start()
+    ok = False
+
+    if profiler == 'cprofile':
+
+        prof.enable()
+
+    elif profiler:
+
+        prof.start()
+
+    try:
+
+        yield
+        ok = True
+
+    finally:
+
+        if profiler == 'cprofile':
+
+            prof.disable()
+            prof.dump_stats(dump_path)
+
+        elif profiler:
+
+            prof.stop()
+
+            with open(dump_path, 'w') as fp:
+
+                fp.write(prof.output_html())
+
+        maxrss1 = peak_stop(peak_token)
+
+        records.append({
+            'task': task.name,
+            'param': param_label,
+            'wall_s': round(time.time() - wall0, 3),
+            'cpu_s': round(time.process_time() - cpu0, 3),
+            'maxrss_mb': (
+                round(maxrss1 / 1024 ** 2, 1)
+                    if maxrss1 is not None else
+                None
+            ),
+            'maxrss_delta_mb': (
+                round((maxrss1 - rss0) / 1024 ** 2, 1)
+                    if maxrss1 is not None and rss0 is not None else
+                None
+            ),
+            'ok': ok,
+            'dump': dump_path,
+        })
+
+
+def pop_records():
+    """
+    Returns the records and removes them from this process, e.g. to send
+    them from a worker to the parent process.
+    """
+
+    result = records[:]
+    del records[:]
+
+    return result
+
+
+def summary_path():
+
+    tables_dir = (
+        getattr(omnipath2.data, 'tables_dir', None) or
+        omnipath2.data.get_param('tables_dir')
+    )
+
+    return os.path.join(
+        tables_dir,
+        '%s__%s.tsv' % (
+            op2_settings.get('task_profile_tsv'),
+            omnipath2.data.timestamp,
+        ),
+    )
+
+
+def write_summary(path = None, top = 10):
+    """
+    Writes a table of the task runs ranked by their wall time, and logs
+    the top ones.
+    """
+
+    if not records:
+
+        return
+
+    path = path or summary_path()
+    ranked = sorted(records, key = lambda rec: rec['wall_s'], reverse = True)
+
+    with open(path, 'w') as fp:
+
+        fp.write('\t'.join(HEADER))
+        fp.write('\n')
+        fp.write(
+            '\n'.join(
+                '\t'.join(str(rec[col]) for col in HEADER)
+                for rec in ranked
+            )
+        )
+
+    _log('Task profile summary written to `%s`.' % path)
+
+    for rec in ranked[:top]:
+
+        _log(
+            '%.01fs wall, %.01fs CPU, %s MB peak RSS: %s%s.' % (
+                rec['wall_s'],
+                rec['cpu_s'],
+                rec['maxrss_mb'],
+                rec['task'],
+                ' (%s)' % rec['param'] if rec['param'] else '',
+            )
+        )
@@ -37,7 +37,6 @@ import time
 import numpy as np
 import pandas as pd
 
-from pypath.inputs import main as dataio
 from pypath.share import progress
 from pypath.share import common
 from pypath.core import entity
@@ -46,6 +45,10 @@ from pypath.resources import network as netres
 import omnipath2
 from omnipath2 import settings as op2_settings
 from omnipath2 import table
+from omnipath2 import lazy
+
+# imports all input modules, needed only by a few tables
+dataio = lazy.lazy_import('pypath.inputs.main')
 
 
 class InterClassConnections(omnipath2.table.TableBase):
@@ -97,9 +100,7 @@ class InterClassConnections(omnipath2.table.TableBase):
         )
 
         self.intercell = omnipath2.data.get_db('intercell')
-        self.intercell.register_network(
-            omnipath2.data.network_df(self.network_dataset)
-        )
+        omnipath2.data.set_network(self.network_dataset)
 
         mode = '' if self.mode == 'undirected' else '_%s' % self.mode
         method = 'count_inter_class_connections%s' % mode
@@ -207,10 +208,17 @@ class IntercellCoverages(omnipath2.table.TableBase):
         self.intercell = omnipath2.data.get_db('intercell')
         self.intercell.make_df()
         self.network = omnipath2.data.get_db(self.network_dataset)
+        index = omnipath2.data.entity_index
 
         network_entities = {
-            'protein': self.network.get_protein_identifiers(),
-            'complex': self.network.get_complex_identifiers(),
+            'protein': omnipath2.data.entity_codes(
+                self.network_dataset,
+                'get_protein_identifiers',
+            ),
+            'complex': omnipath2.data.entity_codes(
+                self.network_dataset,
+                'get_complex_identifiers',
+            ),
         }
 
         self.data = []
@@ -219,11 +227,13 @@ class IntercellCoverages(omnipath2.table.TableBase):
 
             for entity_type in ('protein', 'complex'):
 
-                members = cls.filter_entity_type(entity_type = entity_type)
+                members = index.encode(
+                    cls.filter_entity_type(entity_type = entity_type)
+                )
                 total = len(members)
-                in_network = len(
-                    members &
-                    network_entities[entity_type]
+                in_network = index.count_intersection(
+                    members,
+                    network_entities[entity_type],
                 )
 
                 self.data.append([
@@ -506,8 +516,7 @@ class IntercellNetworkCounts(omnipath2.table.TableBase):
         self.intercell = omnipath2.data.get_db('intercell')
         self.annot = omnipath2.data.get_db('annotations')
         self.network = omnipath2.data.get_db(self.network_dataset)
-        self.network_df = omnipath2.data.network_df(self.network_dataset)
-        self.intercell.register_network(self.network_df)
+        self.network_df = omnipath2.data.set_network(self.network_dataset)
 
 
     def count_connections_pairwise(self):
@@ -695,42 +704,59 @@ class IntercellNetworkByResource(omnipath2.table.TableBase):
     def load(self):
 
         intercell = omnipath2.data.get_db('intercell')
-        network = omnipath2.data.get_db('omnipath')
-
-        intercell.register_network(network)
 
         lig_rec_resources = {r.name for r in netres.ligand_receptor.values()}
         lig_rec_resources.add(None)
 
         l_df = []
 
-        for res in lig_rec_resources:
-
-            annot_res = res or 'OmniPath'
-            only_composite = res is None
-            self._log('Creating intercell network from `%s`.' % annot_res)
-            network_args = {'resource': res}
-            annot_args_source = {'database': annot_res}
-            annot_args_target = {'database': annot_res}
-
-            df = intercell.network_df(
-                network_args = network_args,
-                annot_args_source = annot_args_source,
-                annot_args_target = annot_args_target,
-                only_proteins = True,
-                only_directed = True,
-                transmitter_receiver = True,
-                only_composite = only_composite,
-            )
+        # for out of core networks one chunk of the data frame is
+        # processed at a time, the rows of the intercell network don't
+        # depend on each other; otherwise the network object is used
+        chunks = (
+            not omnipath2.data.client() and
+            omnipath2.data.out_of_core('omnipath')
+        )
+        networks = (
+            omnipath2.data.iter_network_df('omnipath', by_source = True)
+                if chunks else
+            (omnipath2.data.set_network('omnipath', network_object = True),)
+        )
+
+        for network in networks:
+
+            if chunks:
 
-            self._log(
-                'Intercell network created for `%s`, %u interactions.' % (
-                    annot_res,
-                    df.shape[0],
+                intercell.register_network(network)
+
+            for res in lig_rec_resources:
+
+                annot_res = res or 'OmniPath'
+                only_composite = res is None
+                self._log('Creating intercell network from `%s`.' % annot_res)
+                network_args = {'resource': res}
+                annot_args_source = {'database': annot_res}
+                annot_args_target = {'database': annot_res}
+
+                df = intercell.network_df(
+                    network_args = network_args,
+                    annot_args_source = annot_args_source,
+                    annot_args_target = annot_args_target,
+                    only_proteins = True,
+                    only_directed = True,
+                    transmitter_receiver = True,
+                    only_composite = only_composite,
+                )
+
+                self._log(
+                    'Intercell network created for `%s`, '
+                    '%u interactions.' % (
+                        annot_res,
+                        df.shape[0],
+                    )
                 )
-            )
 
-            l_df.append(df)
+                l_df.append(df)
 
         self._log('Concatenating %u data frames.' % len(l_df))
         self.data = pd.concat(l_df)
@@ -919,19 +945,22 @@ class InterClassOverlaps(omnipath2.table.TableBase):
     def load(self):
 
         self.intercell = omnipath2.data.get_db('intercell')
+        index = omnipath2.data.entity_index
 
         self.data = []
 
-        for c0, c1 in (
+        classes = list(
+            self.intercell.iter_classes(
+                scope = 'generic',
+                source = 'composite'
+            )
+        )
+        proteins = [index.encode(cls.proteins) for cls in classes]
+
+        for (c0, p0), (c1, p1) in (
             itertools.product(
-                self.intercell.iter_classes(
-                    scope = 'generic',
-                    source = 'composite'
-                ),
-                self.intercell.iter_classes(
-                    scope = 'generic',
-                    source = 'composite'
-                ),
+                zip(classes, proteins),
+                zip(classes, proteins),
             )
         ):
 
@@ -940,8 +969,8 @@ class InterClassOverlaps(omnipath2.table.TableBase):
                 c1.name,
                 c0.n_proteins,
                 c1.n_proteins,
-                len(c0.proteins | c1.proteins),
-                len(c0.proteins & c1.proteins),
+                index.count_union(p0, p1),
+                index.count_intersection(p0, p1),
             ])
 
 
@@ -984,6 +1013,7 @@ class NetworkCoverage(omnipath2.table.TableBase):
 
         self.annot = omnipath2.data.get_db('annotations')
         self.network = omnipath2.data.get_db(self.network_dataset)
+        index = omnipath2.data.entity_index
 
         self.data = []
 
@@ -992,7 +1022,9 @@ class NetworkCoverage(omnipath2.table.TableBase):
         proteins = dict(
             (
                 (resource.name, resource.data_model, 'resource'),
-                self.network.get_protein_identifiers(
+                omnipath2.data.entity_codes(
+                    self.network_dataset,
+                    'get_protein_identifiers',
                     resources = resource,
                     data_model = resource.data_model
                 )
@@ -1000,14 +1032,19 @@ class NetworkCoverage(omnipath2.table.TableBase):
             for resource in resources
         )
         proteins[('OmniPath', 'all', 'total')] = (
-            self.network.get_protein_identifiers()
+            omnipath2.data.entity_codes(
+                self.network_dataset,
+                'get_protein_identifiers',
+            )
         )
         proteins.update(
             dict(
                 (
                     (data_model, data_model, 'data_model'),
-                    self.network.get_protein_identifiers(
-                        data_model = data_model
+                    omnipath2.data.entity_codes(
+                        self.network_dataset,
+                        'get_protein_identifiers',
+                        data_model = data_model,
                     )
                 )
                 for data_model in self.network.get_data_models()
@@ -1016,7 +1053,7 @@ class NetworkCoverage(omnipath2.table.TableBase):
 
         for annot, label in self.groups:
 
-            this_group = set(
+            this_group = index.encode(
                 e
                 for e in self.annot.annots[annot].annot.keys()
                 if entity.Entity._is_protein(e)
@@ -1035,7 +1072,7 @@ class NetworkCoverage(omnipath2.table.TableBase):
                     label,
                     len(in_network),
                     len(this_group),
-                    len(in_network & this_group),
+                    index.count_intersection(in_network, this_group),
                 ])
 
 
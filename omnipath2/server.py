@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import sys
+import secrets
+import functools
+import itertools
+import threading
+import collections.abc
+import multiprocessing.managers as managers
+
+from pypath.share import session as session_mod
+
+import omnipath2
+from omnipath2 import settings as op2_settings
+from omnipath2 import lazy
+from omnipath2 import chunked
+
+pd = lazy.lazy_import('pandas')
+feather = lazy.lazy_import('pyarrow.feather')
+
+
+_logger = session_mod.Logger(name = 'op2.server')
+_log = _logger._log
+
+# methods with these prefixes modify the datasets, the clients are not
+# allowed to call them as the datasets are shared by all clients
+MUTATING_PREFIXES = (
+    'add_',
+    'build',
+    'clear',
+    'del',
+    'load',
+    'pop',
+    'register',
+    'reload',
+    'remove',
+    'reset',
+    'set_',
+    'update',
+)
+
+# results of these types are sent to the client as lists
+ITERATOR_TYPES = (
+    collections.abc.Iterator,
+    collections.abc.KeysView,
+    collections.abc.ValuesView,
+    collections.abc.ItemsView,
+)
+
+SCALAR_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _is_flat(obj):
+    """
+    Scalars, and lists, tuples, sets and dicts of scalars: these are
+    sent to the client as they are, anything else stays in the server.
+    """
+
+    if isinstance(obj, SCALAR_TYPES):
+
+        return True
+
+    if isinstance(obj, dict):
+
+        obj = itertools.chain(obj.keys(), obj.values())
+
+    elif not isinstance(obj, (list, tuple, set, frozenset)):
+
+        return False
+
+    return all(isinstance(it, SCALAR_TYPES) for it in obj)
+
+
+class DatasetService(object):
+    """
+    Serves the datasets of one ``Database`` to the client processes.
+    The clients call methods or read attributes of the datasets, only the
+    results travel between the processes, the datasets themselves stay in
+    the server's memory.
+
+    Each connection has its own service object. The clients can't modify
+    the datasets, except for selecting the network of the intercell
+    dataset: this selection belongs to the connection, and the network is
+    registered in the intercell object before each call of the client.
+    """
+
+    # the intercell object is shared, only one connection can use it
+    # with its network at a time
+    _intercell_lock = threading.Lock()
+
+
+    def __init__(self, database = None):
+
+        self.database = database or omnipath2.data
+        self.network = None
+
+
+    def datasets(self):
+
+        return list(self.database.datasets)
+
+
+    def call(self, dataset, method, args = (), kwargs = None, path = ()):
+        """
+        Calls a method of a dataset, or of an object within the dataset
+        at ``path`` (see ``get``).
+        """
+
+        if method.startswith(MUTATING_PREFIXES):
+
+            raise PermissionError(
+                'Method `%s` would modify the dataset `%s` shared by all '
+                'clients.' % (method, dataset)
+            )
+
+        if dataset != 'intercell':
+
+            return self._call(dataset, method, args, kwargs, path)
+
+        with self._intercell_lock:
+
+            if self.network:
+
+                self.database.set_network(*self.network)
+
+            return self._call(dataset, method, args, kwargs, path)
+
+
+    def _call(self, dataset, method, args, kwargs, path):
+
+        obj = self._resolve(dataset, path)
+
+        return self._result(getattr(obj, method)(*args, **(kwargs or {})))
+
+
+    @staticmethod
+    def _result(result):
+        """
+        Generators, other iterators and dict views can't be sent to the
+        client, they are converted to lists.
+        """
+
+        return (
+            list(result)
+                if isinstance(result, ITERATOR_TYPES) else
+            result
+        )
+
+
+    def set_network(self, dataset, by_source = False, network_object = False):
+        """
+        Selects the network of the intercell dataset for the calls of
+        this connection.
+        """
+
+        if not network_object:
+
+            self.database.network_df(dataset, by_source = by_source)
+
+        self.network = (dataset, by_source, network_object)
+
+
+    def get(self, dataset, path):
+        """
+        Looks up an object within a dataset. The path is a sequence of
+        ``('attr', name)`` and ``('item', key)`` steps. Scalars and flat
+        containers of scalars are returned as they are; for callables
+        and for any other object only its kind is returned, the client
+        creates a proxy and the object stays in the server.
+
+        Returns a tuple of the kind (`value`, `callable` or `object`) and
+        the value or None.
+        """
+
+        obj = self._resolve(dataset, path)
+
+        return (
+            ('callable', None)
+                if callable(obj) else
+            ('value', obj)
+                if _is_flat(obj) else
+            ('object', None)
+        )
+
+
+    def _resolve(self, dataset, path):
+
+        obj = self.database.get_db(dataset)
+
+        for kind, key in path:
+
+            obj = getattr(obj, key) if kind == 'attr' else obj[key]
+
+        return obj
+
+
+    def network_df(self, dataset, by_source = False):
+        """
+        Returns the path to the columnar file of a network data frame,
+        or the data frame itself if it is not cached in a file.
+        """
+
+        df = self.database.network_df(dataset, by_source = by_source)
+        path = self.database.network_df_cache_path(
+            dataset,
+            self.database._network_df_variant(by_source),
+        )
+
+        return path if path and os.path.exists(path) else df
+
+
+class DatasetManager(managers.BaseManager):
+
+    pass
+
+
+class RemoteDataset(object):
+    """
+    Stands for a dataset, or an object within a dataset, in the server
+    process. Methods are called in the server, only their results are
+    copied to the client. Attributes and items which are scalars or flat
+    containers of scalars are copied, for any other object a proxy is
+    returned, so the large objects (e.g. the annotation databases) stay
+    in the server. Methods which would modify the dataset are refused by
+    the server.
+    """
+
+
+    def __init__(self, service, dataset, path = ()):
+
+        self._service = service
+        self._dataset = dataset
+        self._path = tuple(path)
+
+
+    def __getattr__(self, attr):
+
+        if attr.startswith('_'):
+
+            raise AttributeError(attr)
+
+        return self._get(('attr', attr))
+
+
+    def __getitem__(self, key):
+
+        return self._get(('item', key))
+
+
+    def _get(self, step):
+
+        path = self._path + (step,)
+        kind, value = self._service.get(self._dataset, path)
+
+        if kind == 'value':
+
+            return value
+
+        if kind == 'callable':
+
+            return functools.partial(self._call, self._path, step[1])
+
+        return RemoteDataset(self._service, self._dataset, path)
+
+
+    def _call(self, path, method, *args, **kwargs):
+
+        return self._service.call(
+            self._dataset,
+            method,
+            args,
+            kwargs,
+            path = path,
+        )
+
+
+    def __len__(self):
+
+        return self._call(self._path, '__len__')
+
+
+    def __iter__(self):
+
+        return iter(self._call(self._path, '__iter__'))
+
+
+    def __contains__(self, key):
+
+        return self._call(self._path, '__contains__', key)
+
+
+    def __repr__(self):
+
+        return '<Remote dataset `%s`%s>' % (
+            self._dataset,
+            ''.join(
+                '.%s' % key if kind == 'attr' else '[%r]' % (key,)
+                for kind, key in self._path
+            ),
+        )
+
+
+class DatasetClient(session_mod.Logger):
+    """
+    Connects to a running dataset server.
+    """
+
+
+    def __init__(self, address = None, authkey = None):
+
+        session_mod.Logger.__init__(self, name = 'op2.server')
+
+        self.address = address or server_address()
+        self.authkey = authkey or server_authkey(self.address)
+        self.manager = DatasetManager(
+            address = self.address,
+            authkey = self.authkey,
+        )
+        self.manager.connect()
+        self.service = self.manager.service()
+
+        self._log('Connected to dataset server at `%s`.' % self.address)
+
+
+    def get_db(self, dataset):
+
+        return RemoteDataset(self.service, dataset)
+
+
+    def set_network(self, dataset, by_source = False, network_object = False):
+
+        self.service.set_network(
+            dataset,
+            by_source = by_source,
+            network_object = network_object,
+        )
+
+
+    def network_df(self, dataset, by_source = False):
+
+        df = self.service.network_df(dataset, by_source = by_source)
+
+        if isinstance(df, str):
+
+            df = (
+                pd.read_parquet(df)
+                    if (
+                        df.endswith('parquet') or
+                        not lazy.available('pyarrow')
+                    ) else
+                feather.read_feather(df, memory_map = True)
+            )
+            df = chunked.restore_sets(df)
+
+        return df
+
+
+def server_address():
+
+    address = op2_settings.get('server_address')
+
+    return (
+        tuple(address)
+            if isinstance(address, (list, tuple)) else
+        os.path.abspath(address)
+    )
+
+
+def server_authkey(address = None):
+    """
+    The key of the dataset server: the `server_authkey` setting if it is
+    set, otherwise a random key generated for the user and stored in the
+    `server_authkey_file` readable only by the user. As the key file is
+    available only on the local machine, servers listening on a TCP
+    address require an explicit key.
+    """
+
+    authkey = op2_settings.get('server_authkey')
+
+    if authkey:
+
+        return authkey.encode('ascii') if isinstance(authkey, str) else authkey
+
+    if isinstance(address, tuple):
+
+        raise ValueError(
+            'The dataset server address `%s` is a TCP address: please set '
+            'an explicit `server_authkey`.' % str(address)
+        )
+
+    return _user_authkey()
+
+
+def _user_authkey():
+
+    path = os.path.expanduser(op2_settings.get('server_authkey_file'))
+
+    if not os.path.exists(path):
+
+        os.makedirs(os.path.dirname(path), mode = 0o700, exist_ok = True)
+        tmp_path = '%s.%u.tmp' % (path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+
+        with os.fdopen(fd, 'w') as fp:
+
+            fp.write(secrets.token_hex(32))
+
+        try:
+
+            # fails if another process created the key in the meantime
+            os.link(tmp_path, path)
+            _log('Generated dataset server key in `%s`.' % path)
+
+        except FileExistsError:
+
+            pass
+
+        finally:
+
+            os.remove(tmp_path)
+
+    with open(path, 'r') as fp:
+
+        return fp.read().strip().encode('ascii')
+
+
+def serve(address = None, authkey = None, preload = None):
+    """
+    Runs the dataset server until it is interrupted.
+
+    address : str,tuple
+        Path to a Unix socket or a host and port tuple.
+    authkey : bytes
+        Key the clients need to connect.
+    preload : list
+        Datasets to load before accepting connections.
+    """
+
+    # the server itself loads the datasets
+    op2_settings.setup(dataset_server = False)
+    database = omnipath2.data
+
+    for dataset in preload or ():
+
+        database.get_db(dataset)
+
+    # one service object for each connection
+    DatasetManager.register(
+        'service',
+        callable = lambda: DatasetService(database),
+    )
+
+    address = address or server_address()
+    manager = DatasetManager(
+        address = address,
+        authkey = authkey or server_authkey(address),
+    )
+    server = manager.get_server()
+
+    _log('Dataset server listening at `%s`.' % str(server.address))
+
+    server.serve_forever()
+
+
+DatasetManager.register('service')
+
+
+if __name__ == '__main__':
+
+    serve(preload = sys.argv[1:])
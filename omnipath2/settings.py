@@ -53,6 +53,101 @@ _defaults = {
 
     'timestamp_format': '%Y%m%d',
 
+    # cache the network data frames next to the pickles
+    # (requires `pyarrow`)
+    'network_df_cache': True,
+    # either `feather` or `parquet`
+    'network_df_cache_format': 'feather',
+
+    # network datasets with data frames stored in chunks on the disk
+    # and processed chunk by chunk, e.g. ['mirna_mrna', 'tf_target']
+    # (requires `pyarrow`); only the intercell network by resource table
+    # processes the chunks one by one, the other users of the intercell
+    # network (InterClassConnections, IntercellNetworkCounts,
+    # InterClassChordplotData, InterClassDegreeHisto) and `network_df`
+    # read all chunks into memory
+    'network_df_out_of_core': [],
+    # number of records in one chunk
+    'network_df_chunk_size': 500000,
+
+    # use the datasets from a running dataset server
+    # (`python -m omnipath2.server`)
+    'dataset_server': False,
+    # Unix socket path or (host, port) of the dataset server
+    'server_address': 'op2_server.sock',
+    # key the clients need to connect; if not set, a random key is
+    # generated for the user in `server_authkey_file` (readable only by
+    # the user); an explicit key is required for TCP addresses
+    'server_authkey': None,
+    'server_authkey_file': '~/.omnipath2/server_authkey',
+
+    # number of processes for running the workflow tasks
+    'task_processes': 1,
+    # datasets to load before starting the task processes, in addition
+    # to the `network_dataset`s of the tasks, so the processes share them
+    'task_preload': ['intercell', 'annotations'],
+
+    # skip the tasks which ran before with the same parameters, code,
+    # settings, pypath version and datasets, and link their outputs under
+    # the current timestamp; tasks not using any dataset always run
+    'task_skip_up_to_date': False,
+    # the records of the task runs, in the pickle directory
+    'task_state': 'task_state.json',
+
+    # record the time and memory use of each task run
+    'task_profile': False,
+    # save a profile of each task run: None, `cprofile` or
+    # `pyinstrument` (sampling profiler, if available)
+    'task_profiler': None,
+    'profiles_dir': 'profiles',
+    # summary of the task runs ranked by time, in the tables directory
+    'task_profile_tsv': 'task_profile',
+
+    # checkpoint of the workflow run: the completed task runs, in the
+    # pickle directory
+    'run_state': 'run_state.json',
+    # continue the previous workflow run if it has been interrupted
+    'resume': False,
+
+    # order of the workflow tasks: `declared` or `affinity` (grouped by
+    # the network dataset within the parts of the workflow)
+    'task_schedule': 'declared',
+
+    # number of upcoming task runs to load the datasets for
+    # in the background; 0 disables prefetching
+    'prefetch_tasks': 0,
+
+    # serialization of the datasets: `pypath` (the `save_to_pickle`
+    # methods), `pickle` (protocol 5, streamed, without out-of-band
+    # buffers), `lz4` or `zstd` (the same, compressed)
+    'storage_backend': 'pypath',
+    # threads for zstd compression, -1: as many as CPU cores; the
+    # decompression and the lz4 compression use one thread
+    'storage_threads': -1,
+
+    # record the input files of the builds in this manifest in the
+    # pickle directory, None disables it; see `omnipath2.input_bundle`
+    'input_manifest': 'input_manifest.json',
+    # besides the downloads, record the files created or modified in the
+    # pypath cache directory during the build; lists the whole cache
+    # directory before and after each build
+    'input_manifest_scan': False,
+
+    # add a fingerprint of the build parameters to the pickle file names
+    'pickle_fingerprint': True,
+    # remove the pickles of a dataset built with other parameters when
+    # a new one is saved, together with their caches and snapshots
+    'pickle_remove_superseded': True,
+
+    # export the records of the datasets to memory mappable Arrow files
+    # after building them (requires `pyarrow`)
+    'snapshots': False,
+
+    # create the plain network data frames from the by source ones,
+    # iterating the networks only once; check the result by
+    # `benchmarks/network_df_checks.py` before enabling this
+    'network_df_single_pass': False,
+
     # pickles
     'omnipath_pickle': 'network_omnipath.pickle',
     'curated_pickle': 'network_curated.pickle',
@@ -65,6 +160,9 @@ _defaults = {
     'mirna_mrna_pickle': 'mirna_mrna.pickle',
     'lncrna_mrna_pickle': 'lncrna_mrna.pickle',
 
+    # build and load statistics of the datasets
+    'dataset_stats': 'dataset_stats',
+
     # supplementary tables
     'network_s2_tsv': 'S2_network_%s%s',
     'enzsub_s3_tsv': 'S3_enz-sub',
@@ -128,6 +226,48 @@ _defaults = {
         'annotations': ('complex',),
     },
 
+    # datasets created in memory from another dataset instead of
+    # a separate build, see `Database.build_view`; the curated network
+    # keeps the resources of `Database.get_args_curated` from `omnipath`;
+    # the DoRothEA levels of `tf_target` can be selected like
+    # `{'tf_target_ab': {'parent': 'tf_target',
+    # 'filter': 'dorothea_levels', 'levels': {'A', 'B'}}}`
+    'dataset_views': {
+        'curated': {'parent': 'omnipath'},
+    },
+
+    # cache the parsed inputs while building the datasets
+    'input_cache': False,
+    # memory limit of the input cache in MB
+    'input_cache_size': 4096,
+    # share the input cache between the build processes by a directory
+    # within `pickle_dir`, it is removed at the end of the build
+    'input_cache_shared': True,
+    # size limit of the shared input cache in MB, None: no limit
+    'input_cache_shared_size': 16384,
+
+    # number of processes for building the datasets
+    'build_processes': 1,
+    # build each dataset in a child process which exits after saving the
+    # pickle, the parent loads the dataset from the pickle
+    'build_isolated': False,
+    # kill the isolated builds above this memory (GB), not counting the
+    # pages the build process shares with its parent
+    'build_max_rss': None,
+
+    # memory budget for the loaded datasets in GB, the least recently
+    # used datasets are evicted above this; None means no limit
+    'memory_budget': None,
+    # the memory use of a loaded dataset is estimated as its pickle size
+    # multiplied by this factor; the compressed pickles are smaller
+    # hence they have larger factors; a number applies to all backends
+    'memory_pickle_factor': {
+        'pypath': 4.,
+        'pickle': 4.,
+        'lz4': 8.,
+        'zstd': 12.,
+    },
+
     # figures graphic param defaults
     'font_family': [
         # we want to use this:
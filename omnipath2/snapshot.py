@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+
+from pypath.share import session as session_mod
+
+from omnipath2 import lazy
+
+pd = lazy.lazy_import('pandas')
+pa = lazy.lazy_import('pyarrow')
+
+
+_logger = session_mod.Logger(name = 'op2.snapshot')
+_log = _logger._log
+
+
+def records_network(database, dataset):
+    """
+    Interactions with their resources and references, one row for each
+    resource.
+    """
+
+    return database.network_df(dataset, by_source = True)
+
+
+def records_annot(database, dataset):
+    """
+    Annotation records in narrow format: one row for each field of each
+    record.
+    """
+
+    db = database.get_db(dataset)
+
+    if hasattr(db, 'make_narrow_df'):
+
+        db.make_narrow_df()
+
+        return db.narrow_df
+
+    rows = []
+
+    for resource, annot in db.annots.items():
+
+        for entity, records in annot.annot.items():
+
+            for record_id, record in enumerate(records):
+
+                for label, value in record._asdict().items():
+
+                    rows.append(
+                        (str(entity), resource, record_id, label, value)
+                    )
+
+    return pd.DataFrame(
+        rows,
+        columns = ['entity', 'source', 'record_id', 'label', 'value'],
+    )
+
+
+def records_df(database, dataset):
+    """
+    Records of the datasets which provide a ``make_df`` method, such as
+    intercell (class memberships), enzyme-substrate and complexes.
+    """
+
+    db = database.get_db(dataset)
+    db.make_df()
+
+    return db.df
+
+
+RECORDS = {
+    'network': records_network,
+    'annot': records_annot,
+    'intercell': records_df,
+    'enz_sub': records_df,
+    'complex': records_df,
+}
+
+
+def arrow_safe(df):
+    """
+    Converts the columns of Python objects (e.g. sets of resources) to
+    strings, so the data frame can be stored in Arrow format.
+    """
+
+    df = df.copy()
+
+    for col in df.columns:
+
+        if df[col].dtype == object:
+
+            df[col] = [
+                (
+                    ';'.join(sorted(str(v) for v in val))
+                        if isinstance(val, (set, frozenset, list, tuple)) else
+                    None
+                        if val is None else
+                    str(val)
+                )
+                for val in df[col]
+            ]
+
+    return df
+
+
+def export(df, path):
+    """
+    Writes a data frame to an uncompressed Arrow IPC file, which can be
+    memory mapped when read.
+    """
+
+    table = pa.Table.from_pandas(arrow_safe(df), preserve_index = False)
+    tmp_path = '%s.tmp' % path
+
+    with pa.OSFile(tmp_path, 'wb') as sink:
+
+        with pa.ipc.new_file(sink, table.schema) as writer:
+
+            writer.write_table(table)
+
+    os.replace(tmp_path, path)
+
+    _log('Snapshot exported to `%s`.' % path)
+
+
+def read(path, columns = None):
+    """
+    Opens an Arrow IPC file memory mapped. The columns are not read
+    until they are accessed.
+    """
+
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+
+    return table.select(columns) if columns else table
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import io
+import os
+import pickle
+import contextlib
+
+from pypath.share import session as session_mod
+
+try:
+
+    import lz4.frame as lz4_frame
+
+except ImportError:
+
+    lz4_frame = None
+
+try:
+
+    import zstandard
+
+except ImportError:
+
+    zstandard = None
+
+
+_logger = session_mod.Logger(name = 'op2.storage')
+_log = _logger._log
+
+MAGIC = b'OP2STOR2'
+
+BACKENDS = {
+    # file name suffix, compression
+    'pypath': ('', None),
+    'pickle': ('.op2', None),
+    'lz4': ('.op2.lz4', 'lz4'),
+    'zstd': ('.op2.zst', 'zstd'),
+}
+
+
+def suffix(backend):
+    """
+    File name suffix appended to the pickle file names for a backend.
+    """
+
+    return BACKENDS[backend][0]
+
+
+def available(backend):
+    """
+    Tells if the modules required by a backend are installed.
+    """
+
+    compression = BACKENDS[backend][1]
+
+    return (
+        (compression != 'lz4' or lz4_frame is not None) and
+        (compression != 'zstd' or zstandard is not None)
+    )
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Replaces the pypath session logger, which holds open files, by a
+    reference which is resolved to the current session's logger at
+    loading.
+    """
+
+    def persistent_id(self, obj):
+
+        if obj is _session_log():
+
+            return 'session_log'
+
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+
+
+    def persistent_load(self, pid):
+
+        if pid == 'session_log':
+
+            return _session_log()
+
+        raise pickle.UnpicklingError('Unknown persistent id: `%s`.' % pid)
+
+
+def _session_log():
+
+    return session_mod.get_log()
+
+
+def save(obj, path, backend = 'pickle', threads = -1, level = None):
+    """
+    Saves an object by pickle protocol 5, optionally compressed by lz4 or
+    zstd. The pickle is streamed through the compressor into the file,
+    hence neither the whole pickle nor its compressed copy is held in
+    memory. There are no out-of-band buffers: they would have to be
+    written after the pickle, and read before unpickling it, hence the
+    whole pickle would have to be held in memory at loading. The
+    ``pypath`` backend is not handled here, it uses the
+    ``save_to_pickle`` method of the objects.
+
+    obj : object
+        The object to save.
+    path : str
+        Path to the output file.
+    backend : str
+        Name of the backend, see ``BACKENDS``.
+    threads : int
+        Number of threads for zstd compression, -1 means as many as
+        CPU cores.
+    level : int
+        Compression level, None for the library default.
+    """
+
+    compression = BACKENDS[backend][1]
+    tmp_path = '%s.tmp' % path
+
+    with open(tmp_path, 'wb') as fp:
+
+        fp.write(MAGIC)
+
+        if compression == 'lz4':
+
+            stream = lz4_frame.open(
+                fp,
+                mode = 'wb',
+                compression_level = level or 0,
+            )
+
+        elif compression == 'zstd':
+
+            stream = zstandard.ZstdCompressor(
+                level = level or 3,
+                threads = threads,
+            ).stream_writer(fp)
+
+        else:
+
+            stream = contextlib.nullcontext(fp)
+
+        with stream as writer:
+
+            # large buffers are written by the pickler directly into
+            # the stream, without copying them into the frames
+            _Pickler(writer, protocol = 5).dump(obj)
+
+    os.replace(tmp_path, path)
+
+    _log('Saved object to `%s` (backend: `%s`).' % (path, backend))
+
+
+def load(path, backend = 'pickle'):
+    """
+    Loads an object saved by ``save``. The file is decompressed while
+    unpickling, in small blocks, in one thread.
+    """
+
+    compression = BACKENDS[backend][1]
+
+    with open(path, 'rb') as fp:
+
+        if fp.read(len(MAGIC)) != MAGIC:
+
+            raise ValueError('Not an OmniPath2 storage file: `%s`.' % path)
+
+        if compression == 'lz4':
+
+            stream = lz4_frame.open(fp, mode = 'rb')
+
+        elif compression == 'zstd':
+
+            stream = io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(fp)
+            )
+
+        else:
+
+            stream = contextlib.nullcontext(fp)
+
+        with stream as reader:
+
+            obj = _Unpickler(reader).load()
+
+    _log('Loaded object from `%s` (backend: `%s`).' % (path, backend))
+
+    return obj
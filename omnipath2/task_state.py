@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2019-2020 Saez Lab
+#
+# OmniPath2 analysis and figures suite
+#
+# Authors:
+#
+# Nicolàs Palacio-Escat
+# nicolas.palacio@bioquant.uni-heidelberg.de
+#
+# Dénes Türei
+# turei.denes@gmail.com
+#
+#
+#  Distributed under the GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://omnipathdb.org/
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+from pypath.share import session as session_mod
+
+import pypath
+
+import omnipath2
+from omnipath2 import settings as op2_settings
+from omnipath2 import fingerprint
+
+
+_logger = session_mod.Logger(name = 'op2.task_state')
+_log = _logger._log
+
+# settings which don't affect the outputs of the tasks: the ones which
+# change in each run (the timestamped directories), and the ones about
+# how the datasets are built, stored, cached and kept in memory, and how
+# the tasks are run; the rest is part of the task records
+VOLATILE_SETTINGS = {
+    'tables_dir',
+    'figures_dir',
+    'profiles_dir',
+    'dataset_server',
+    'prefetch_tasks',
+    'run_state',
+    'resume',
+    'snapshots',
+    'input_manifest',
+    'input_manifest_scan',
+    'pickle_fingerprint',
+    'pickle_remove_superseded',
+    'dataset_stats',
+    'parallel_worker',
+}
+
+# all settings with these prefixes are volatile, as above
+VOLATILE_PREFIXES = (
+    'build_',
+    'input_cache',
+    'memory_',
+    'network_df_',
+    'server_',
+    'storage_',
+    'task_',
+)
+
+
+def volatile(key):
+    """
+    Tells if a setting doesn't affect the outputs of the tasks.
+    """
+
+    return key in VOLATILE_SETTINGS or key.startswith(VOLATILE_PREFIXES)
+
+
+def state_path(key):
+    """
+    Path of a state file from the settings: relative paths are in the
+    pickle directory, next to the datasets the states refer to.
+    """
+
+    path = os.path.join(
+        omnipath2.data.get_param('pickle_dir'),
+        op2_settings.get(key),
+    )
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    return path
+
+
+class TaskState(session_mod.Logger):
+    """
+    Keeps track of the successful runs of the workflow tasks: for each
+    task and parameter combination, the fingerprints of the datasets it
+    used, a hash of its code, a hash of the settings, the pypath version
+    and the paths of its outputs. A run can be skipped if none of these
+    changed and its outputs still exist.
+    """
+
+
+    def __init__(self, path = None):
+
+        session_mod.Logger.__init__(self, name = 'op2.task_state')
+
+        self.path = path or state_path('task_state')
+        self.records = {}
+        self._fingerprints = {}
+        self._code_digests = {}
+        self.read()
+
+
+    def read(self):
+
+        if os.path.exists(self.path):
+
+            with open(self.path, 'r') as fp:
+
+                self.records = json.load(fp)
+
+
+    def write(self):
+
+        tmp_path = '%s.tmp' % self.path
+
+        with open(tmp_path, 'w') as fp:
+
+            json.dump(self.records, fp, sort_keys = True, indent = 4)
+
+        os.replace(tmp_path, self.path)
+
+
+    @staticmethod
+    def key(task, param):
+
+        return fingerprint.digest({'method': task.method, 'param': param})
+
+
+    def code_digest(self, task):
+        """
+        A hash of the source files of the modules which define the task,
+        including the modules of its base classes within ``omnipath2``.
+        """
+
+        method = task.get_method()
+        modules = {
+            cls.__module__
+            for cls in (
+                method.__mro__
+                    if isinstance(method, type) else
+                (method,)
+            )
+            if cls.__module__.split('.')[0] == 'omnipath2'
+        }
+        sha256 = hashlib.sha256()
+
+        for module in sorted(modules):
+
+            if module not in self._code_digests:
+
+                path = getattr(sys.modules[module], '__file__', None)
+
+                with open(path, 'rb') as fp:
+
+                    self._code_digests[module] = (
+                        hashlib.sha256(fp.read()).hexdigest()
+                    )
+
+            sha256.update(self._code_digests[module].encode('ascii'))
+
+        return sha256.hexdigest()
+
+
+    @staticmethod
+    def settings_digest():
+        """
+        A hash of the current settings, except the volatile ones (see
+        ``volatile``).
+        """
+
+        return fingerprint.digest({
+            key: value
+            for key, value in vars(op2_settings.settings).items()
+            if not volatile(key)
+        })
+
+
+    def dataset_fingerprints(self, jobs):
+        """
+        Computes the fingerprints of the datasets the jobs used in their
+        previous runs. Calling this before forking the worker processes
+        spares computing the same fingerprints in each worker.
+
+        jobs : list
+            Objects with ``task`` and ``param`` attributes.
+        """
+
+        for job in jobs:
+
+            record = self.records.get(self.key(job.task, job.param))
+
+            for dataset in (record or {}).get('datasets', ()):
+
+                self.dataset_fingerprint(dataset)
+
+
+    def dataset_fingerprint(self, dataset):
+
+        if dataset not in self._fingerprints:
+
+            self._fingerprints[dataset] = omnipath2.data.fingerprint(dataset)
+
+        return self._fingerprints[dataset]
+
+
+    def record(self, task, param, datasets, outputs):
+        """
+        Creates the record of a successful run.
+
+        datasets : set
+            Names of the datasets accessed by the task.
+        outputs : list
+            Paths to the files written by the task.
+        """
+
+        return {
+            'key': self.key(task, param),
+            'task': task.name,
+            'param': fingerprint.stable_repr(param),
+            'code': self.code_digest(task),
+            'settings': self.settings_digest(),
+            'pypath': getattr(pypath, '__version__', None),
+            'datasets': {
+                dataset: self.dataset_fingerprint(dataset)
+                for dataset in sorted(datasets)
+            },
+            'outputs': list(outputs),
+            'timestamp': omnipath2.data.timestamp,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+
+    def update(self, record):
+
+        self.records[record['key']] = record
+        self.write()
+
+
+    def up_to_date(self, task, param):
+        """
+        Returns the record of the last run if the task with these
+        parameters does not need to run again, None otherwise. Tasks which
+        did not access any dataset are always run, as their inputs are
+        not known (e.g. they read tables written by other tasks).
+        """
+
+        record = self.records.get(self.key(task, param))
+
+        if (
+            record and
+            record['datasets'] and
+            record['outputs'] and
+            record['code'] == self.code_digest(task) and
+            record.get('settings') == self.settings_digest() and
+            record.get('pypath') == getattr(pypath, '__version__', None) and
+            all(os.path.exists(path) for path in record['outputs']) and
+            all(
+                self.dataset_fingerprint(dataset) == dataset_fingerprint
+                for dataset, dataset_fingerprint in record['datasets'].items()
+            )
+        ):
+
+            return record
+
+
+
+
+class RunState(session_mod.Logger):
+    """
+    Checkpoint of a workflow run: the jobs (task and parameter
+    combinations) completed so far and their outputs, written after each
+    job. A run interrupted e.g. by preemption can be resumed by the next
+    one, which skips the jobs already completed.
+    """
+
+
+    def __init__(self, path = None):
+
+        session_mod.Logger.__init__(self, name = 'op2.run_state')
+
+        self.path = path or state_path('run_state')
+        self.done = {}
+        self.started = None
+        self.finished = False
+
+
+    def start(self, resume = False):
+        """
+        Starts a new run, or, if ``resume`` is True and the previous run
+        has not finished, continues that one.
+        """
+
+        previous = None
+
+        if os.path.exists(self.path):
+
+            with open(self.path, 'r') as fp:
+
+                previous = json.load(fp)
+
+        if resume and previous and not previous['finished']:
+
+            self.done = previous['done']
+            self.started = previous['started']
+
+            self._log(
+                'Resuming the workflow run started at %s, '
+                '%u jobs have been completed.' % (
+                    self.started,
+                    len(self.done),
+                )
+            )
+
+        else:
+
+            if resume:
+
+                self._log('No interrupted run to resume, starting a new one.')
+
+            self.done = {}
+            self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        self.finished = False
+        self.write()
+
+
+    def completed(self, job):
+        """
+        Returns the record of a job if it has been completed in the run
+        and its outputs still exist, None otherwise.
+        """
+
+        record = self.done.get(TaskState.key(job.task, job.param))
+
+        if record and all(os.path.exists(path) for path in record['outputs']):
+
+            return record
+
+
+    def checkpoint(self, job, record):
+
+        self.done[TaskState.key(job.task, job.param)] = {
+            'task': job.task.name,
+            'outputs': record['outputs'],
+            'timestamp': record['timestamp'],
+        }
+        self.write()
+
+
+    def finish(self):
+
+        self.finished = True
+        self.write()
+
+
+    def write(self):
+
+        tmp_path = '%s.tmp' % self.path
+
+        with open(tmp_path, 'w') as fp:
+
+            json.dump(
+                {
+                    'started': self.started,
+                    'finished': self.finished,
+                    'done': self.done,
+                },
+                fp,
+                sort_keys = True,
+                indent = 4,
+            )
+
+        os.replace(tmp_path, self.path)
+
+
+def link_forward(record):
+    """
+    Makes the outputs of an earlier run available under the current
+    timestamp by hard links (or copies, if linking is not possible).
+    Returns the updated record.
+    """
+
+    timestamp = omnipath2.data.timestamp
+    outputs = []
+
+    for path in record['outputs']:
+
+        new_path = path.replace(record['timestamp'], timestamp)
+
+        if not os.path.exists(new_path):
+
+            os.makedirs(os.path.dirname(new_path), exist_ok = True)
+
+            try:
+
+                os.link(path, new_path)
+
+            except OSError:
+
+                shutil.copy2(path, new_path)
+
+            _log('Linked `%s` to `%s`.' % (path, new_path))
+
+        omnipath2.files.update_record(new_path)
+        outputs.append(new_path)
+
+    return dict(record, outputs = outputs, timestamp = timestamp)